@@ -25,6 +25,7 @@ An Accessory for Adafruit NeoPixels attached to GPIO Pin18
  Changing Brightness - Brightness - State
  Changing Color      - Saturation - Hue
  Changing Temp/Sat   - Saturation - Hue
+ Changing Temperature - ColorTemperature
  Changing State On    - State
  First Power On at boot - Brightness - State
 
@@ -33,26 +34,51 @@ An Accessory for Adafruit NeoPixels attached to GPIO Pin18
  Saturation: 0 - 100
  Brightness: 0 - 100
  State: 0 - 1
+ ColorTemperature: 140 - 500 mired
 """
 
-import neopixel
+import asyncio
 from random import randrange
 import time
 import colorsys
 
+import numpy as np
+
 from pyhap.accessory import Accessory
 from pyhap.const import CATEGORY_LIGHTBULB
 
+from calibration import Calibration
+from color_conversion import hsv_to_rgb, hsv_to_rgb_fine, mired_to_hs, mired_to_rgb, mired_to_rgb_fine, V_SCALE
+from effect_scheduler import EffectScheduler
+from effects import EFFECTS
+from event_trace import TRACE
+from fade_engine import ColorFade
+from fast_boot import Snapshot, SnapshotWriter, load_snapshot
+from frame_clock import FrameClock
+from frame_coalescer import FrameCoalescer
+from frame_buffer import FrameBuffer
+from metrics import METRICS, timed_setter
+from output_backends import make_output
+from render_thread import RenderThread
+
 
 class NeoPixelColor:
     """Class is used for easy passing and converting of colors between
     Apple HomeKit API and NeoPixel Library
-    Conversion from HSV to RGB use python colorsys library whos values 
-    range from 0 - 1 which require conversions to 8bit rgb and HomeKit API 
-    standards"""
+    Conversion from HSV to RGB uses the shared color_conversion lookup tables
+    which take HomeKit API values directly and return 8bit rgb
+    Conversion from RGB to HSV use python colorsys library whos values
+    range from 0 - 1 which require conversions to 8bit rgb and HomeKit API
+    standards
+    A color set from a HomeKit color temperature keeps its mired and is shown
+    from the color temperature table, its hue and saturation are the closest match
+    Colors use __slots__ and the pre defined colors are shared immutable
+    instances, use copy_from to update a color in place without allocating"""
 
     #  TODO: - Find all functions that are not used and remove them
 
+    __slots__ = ('_red', '_green', '_blue', '_hue', '_saturation', '_brightness', '_mired')
+
     def __init__(self):
         """Do not invoke directly - Use class methods
         We are setting a default red just incase"""
@@ -62,6 +88,7 @@ class NeoPixelColor:
         self._hue = 0
         self._saturation = 100
         self._brightness = 100
+        self._mired = None  # None unless the color is a color temperature
 
     @classmethod
     def from_rgb(cls, red, green, blue):
@@ -78,8 +105,7 @@ class NeoPixelColor:
     @classmethod
     def from_color(cls, color):
         return_color = cls()
-        rgb_tuple = color.get_rgb()
-        return_color.set_color_with_rgb(rgb_tuple[0], rgb_tuple[1], rgb_tuple[2])
+        return_color.copy_from(color)
         return return_color
 
     @classmethod
@@ -91,36 +117,27 @@ class NeoPixelColor:
         color.set_color_with_rgb(red, green, blue)
         return color
 
-    # Pre defined Colors
+    # Pre defined Colors - These are shared and cannot be changed
+    #                     use from_color to get a copy that can be changed
     @classmethod
     def black(cls):
-        color = cls()
-        color.set_color_with_rgb(0, 0, 0)
-        return color
+        return _BLACK
 
     @classmethod
     def white(cls):
-        color = cls()
-        color.set_color_with_rgb(255, 255, 255)
-        return color
+        return _WHITE
 
     @classmethod
     def blue(cls):
-        color = cls()
-        color.set_color_with_rgb(0, 0, 255)
-        return color
+        return _BLUE
 
     @classmethod
     def green(cls):
-        color = cls()
-        color.set_color_with_rgb(0, 255, 0)
-        return color
+        return _GREEN
 
     @classmethod
     def red(cls):
-        color = cls()
-        color.set_color_with_rgb(255, 0, 0)
-        return color
+        return _RED
 
     # End predefined colors
 
@@ -132,15 +149,33 @@ class NeoPixelColor:
                                  randrange(256))
         return color
 
-    def _update_member_rgb_values(self, rgb_tuple):
-        self._red = rgb_tuple[0] * 255
-        self._green = rgb_tuple[1] * 255
-        self._blue = rgb_tuple[2] * 255
+    def _update_member_rgb_values(self):
+        if self._mired is not None:
+            self._red, self._green, self._blue = mired_to_rgb(self._mired, self._brightness)
+            return
+        self._red, self._green, self._blue = hsv_to_rgb(self._hue, self._saturation, self._brightness)
 
     def get_rgb(self):
         return self._red, self._green, self._blue
 
+    def get_rgb_fine(self):
+        """red, green, blue as floats 0.0 - 255.0 without rounding the brightness"""
+        if self._mired is not None:
+            return mired_to_rgb_fine(self._mired, self._brightness)
+        return hsv_to_rgb_fine(self._hue, self._saturation, self._brightness)
+
+    def copy_from(self, color):
+        """Copies another color into this one without any conversion"""
+        self._red = color._red
+        self._green = color._green
+        self._blue = color._blue
+        self._hue = color._hue
+        self._saturation = color._saturation
+        self._brightness = color._brightness
+        self._mired = color._mired
+
     def set_color_with_rgb(self, red, green, blue):
+        self._mired = None
         self._red = red
         self._green = green
         self._blue = blue
@@ -163,56 +198,52 @@ class NeoPixelColor:
         return hexColour
 
     def set_color_with_hsv(self, hue, saturation, brightness):
+        self._mired = None
         self._hue = hue
         self._saturation = saturation
         self._brightness = brightness
-        rgb = colorsys.hsv_to_rgb(hue / 360,
-                                  saturation / 100,
-                                  brightness / 100)
-        self._red = rgb[0] * 255
-        self._green = rgb[1] * 255
-        self._blue = rgb[2] * 255
+        self._update_member_rgb_values()
+
+    def set_color_with_mired(self, mired, brightness):
+        """Sets a HomeKit color temperature - mired 140 - 500"""
+        self._mired = mired
+        self._hue, self._saturation = mired_to_hs(mired)
+        self._brightness = brightness
+        self._update_member_rgb_values()
+
+    def get_mired(self):
+        """The color temperature in mired, None when the color is not one"""
+        return self._mired
 
     def get_hue(self):
         return self._hue
 
     def set_hue(self, hue):
+        self._mired = None
         self._hue = hue
-        rgb = colorsys.hsv_to_rgb(self._hue / 360,
-                                  self._saturation / 100,
-                                  self._brightness / 100)
-        self._update_member_rgb_values(rgb)
+        self._update_member_rgb_values()
 
     def adj_hue(self, value):
+        self._mired = None
         self._hue += value
-        rgb = colorsys.hsv_to_rgb(self._hue / 360,
-                                  self._saturation / 100,
-                                  self._brightness / 100)
-        self._update_member_rgb_values(rgb)
+        self._update_member_rgb_values()
 
     def get_saturation(self):
         return self._saturation
 
     def set_saturation(self, saturation):
+        self._mired = None
         self._saturation = saturation
-        rgb = colorsys.hsv_to_rgb(self._hue / 360,
-                                  self._saturation / 100,
-                                  self._brightness / 100)
-        self._update_member_rgb_values(rgb)
+        self._update_member_rgb_values()
 
     def adj_saturation(self, value):
+        self._mired = None
         self._saturation += value
-        rgb = colorsys.hsv_to_rgb(self._hue / 360,
-                                  self._saturation / 100,
-                                  self._brightness / 100)
-        self._update_member_rgb_values(rgb)
+        self._update_member_rgb_values()
 
     def set_brightness(self, brightness):
         self._brightness = brightness
-        rgb = colorsys.hsv_to_rgb(self._hue / 360,
-                                  self._saturation / 100,
-                                  self._brightness / 100)
-        self._update_member_rgb_values(rgb)
+        self._update_member_rgb_values()
 
     def is_equal_with(self, color):
         result = False
@@ -222,42 +253,80 @@ class NeoPixelColor:
         return result
 
 
+class _ConstantNeoPixelColor(NeoPixelColor):
+    """Immutable color used for the shared pre defined colors"""
+
+    __slots__ = ()
+
+    def __init__(self, red, green, blue):
+        super().__init__()
+        NeoPixelColor.set_color_with_rgb(self, red, green, blue)
+
+    def _immutable(self, *args):
+        raise TypeError("Pre defined NeoPixelColors cannot be changed - Use NeoPixelColor.from_color for a copy")
+
+    set_color_with_rgb = _immutable
+    set_color_with_hsv = _immutable
+    set_color_with_mired = _immutable
+    copy_from = _immutable
+    set_hue = _immutable
+    adj_hue = _immutable
+    set_saturation = _immutable
+    adj_saturation = _immutable
+    set_brightness = _immutable
+
+
+_BLACK = _ConstantNeoPixelColor(0, 0, 0)
+_WHITE = _ConstantNeoPixelColor(255, 255, 255)
+_BLUE = _ConstantNeoPixelColor(0, 0, 255)
+_GREEN = _ConstantNeoPixelColor(0, 255, 0)
+_RED = _ConstantNeoPixelColor(255, 0, 0)
+
+
 class ColorFadeColors:
     """ This class stores the color fade colors and allows
     convenience for adding and removing
-    Max Storage = 2 """
+    Max Storage = 2
+    Colors are updated in place so the fade loop does not allocate """
 
     # TODO: - Find all functions that are not used and remove them
 
+    __slots__ = ('_primaryColor', '_secondaryColor', '_current_pixel_color')
+
     def __init__(self, color1, color2, color3):
         self._primaryColor = color1  # Start of the color fade
         self._secondaryColor = color2  # End of the color fade
         self._current_pixel_color = color3  # The current color between start and end
 
-    def insert_new_color(self, color):  # TODO: - This function can probably repalced by - GetPrimary = new_color
-        self._secondaryColor = self._primaryColor
-        self._primaryColor = color
+    def insert_new_color(self, color):
+        """Moves the primary color to secondary and copies color in as the new primary"""
+        self._secondaryColor.copy_from(self._primaryColor)
+        self._primaryColor.copy_from(color)
+
+    def insert_new_hue(self, hue):
+        """Same as insert_new_color where the new primary is the old primary with a new hue"""
+        self._secondaryColor.copy_from(self._primaryColor)
+        self._primaryColor.set_hue(hue)
+
+    def insert_new_mired(self, mired):
+        """Same as insert_new_color where the new primary is a color temperature at the old brightness"""
+        self._secondaryColor.copy_from(self._primaryColor)
+        self._primaryColor.set_color_with_mired(mired, self._primaryColor.get_hsv()[2])
 
     def set_primary_color(self, color):
-        self._primaryColor.set_color_with_rgb(color.get_rgb()[0],
-                                              color.get_rgb()[1],
-                                              color.get_rgb()[2])
+        self._primaryColor.copy_from(color)
 
     def get_primary_color(self):
         return self._primaryColor
 
     def set_secondary_color(self, color):
-        self._secondaryColor.set_color_with_rgb(color.get_rgb()[0],
-                                                color.get_rgb()[1],
-                                                color.get_rgb()[2])
+        self._secondaryColor.copy_from(color)
 
     def get_secondary_color(self):
         return self._secondaryColor
 
     def set_current_pixel_color(self, color):
-        self._current_pixel_color.set_color_with_rgb(color.get_rgb()[0],
-                                                     color.get_rgb()[1],
-                                                     color.get_rgb()[2])
+        self._current_pixel_color.copy_from(color)
 
     def get_current_pixel_color(self):
         return self._current_pixel_color
@@ -281,11 +350,19 @@ class ColorFadeColors:
 
 class NeoPixelLightStrip_Fader(Accessory):
     category = CATEGORY_LIGHTBULB
-    COLOR_FADE_INTERVAL = 1
+    COLOR_FADE_FPS = 30  # frames per second the color fade is rendered at
+    COLOR_FADE_TRANSITION_LENGTH = 60 * 10  # seconds from primary to secondary color
+    EFFECT_FPS = 60  # frames per second effects are rendered at
+    EFFECT = "rainbow"  # first effect of effect mode, the power gesture steps through the rest of effects.EFFECTS
+    MODE_COUNT = 4  # Mode0x00: Single Color, Mode0x01: Color Fade, Mode0x02: Effect, Mode0x03: Recorded Show
+    FRAME_COALESCE_WINDOW = 0.01  # seconds to collect HomeKit writes into one frame
+    _EFFECT_WORKER_PAUSED = {"on": False}
 
     def __init__(self, startup_in_color_fade_mode: bool, LED_count, is_GRB: bool, LED_pin,
                  LED_freq_hz, LED_DMA, LED_brightness,
-                 LED_invert: bool, *args, **kwargs):
+                 LED_invert: bool, *args, render_thread=None, frame_clock=None,
+                 effect_worker=False, output=None, realtime_port=None, realtime_universe=1,
+                 show_file=None, snapshot_file=None, calibration=None, dither_fps=None, **kwargs):
 
         """
         startup_in_color_fade_mode - this will run color fade mode at startup
@@ -298,13 +375,30 @@ class NeoPixelLightStrip_Fader(Accessory):
         LED_invert - Normal:False
         For more information regarding these settings
             please review rpi_ws281x source code
+        Note: LED_freq_hz, LED_DMA and LED_invert are fixed by the Adafruit
+              neopixel driver and only kept for compatibility
+        The strip is created by output_backends.make_output, set JLIGHTS_OUTPUT=sim
+            to run without a Raspberry Pi
+        output - output backend for this strip ie "ddp:192.168.1.50" - Normal:None uses JLIGHTS_OUTPUT
+        render_thread - shared RenderThread to push frames on - Normal:None this strip gets its own
+        frame_clock - shared FrameClock that calls render_tick - Normal:None this strip runs its own
+        effect_worker - draw effects in a worker process, see shared_framebuffer - Normal:False
+        realtime_port - UDP port to take DDP or E1.31 frames on, see realtime_ingest - Normal:None off
+        realtime_universe - first E1.31 universe of this strip - Normal:1
+        show_file - recorded show played in show mode, see recorded_show - Normal:None no show mode
+        snapshot_file - the last state is kept here and restored at start up, see fast_boot - Normal:None off
+        calibration - gamma, white balance and current limit of this strip, a calibration.Calibration
+                      or its config dict - Normal:None linear
+        dither_fps - temporally dither single color and color fade at this frame rate, see
+                     frame_buffer - Normal:None off, on a shared frame_clock it dithers at the clock's rate
+        The effect worker, realtime receiver and show modules are only imported when they are used
         """
 
         super().__init__(*args, **kwargs)
 
         # Set our neopixel API services up using Lightbulb base
         serv_light = self.add_preload_service(
-            'Lightbulb', chars=['On', 'Hue', 'Saturation', 'Brightness'])
+            'Lightbulb', chars=['On', 'Hue', 'Saturation', 'Brightness', 'ColorTemperature'])
 
         # Configure our callbacks
         self.char_hue = serv_light.configure_char(
@@ -315,30 +409,100 @@ class NeoPixelLightStrip_Fader(Accessory):
             'On', setter_callback=self.state_changed)
         self.char_on = serv_light.configure_char(
             'Brightness', setter_callback=self.brightness_changed)
+        self.char_temperature = serv_light.configure_char(
+            'ColorTemperature', setter_callback=self.temperature_changed)
 
         self.accessory_state = 0
         self.is_GRB = is_GRB  # Most neopixels are Green Red Blue
         self.LED_count = LED_count
 
-        self.neo_strip = neopixel.NeoPixel(LED_count, LED_pin, LED_freq_hz,
-                                           LED_DMA, LED_invert, LED_brightness)
-        self.neo_strip.begin()
+        pixel_order = "GRB" if is_GRB else "RGB"
+        self.neo_strip = make_output(LED_count, pixel_order, LED_pin, output)
+        # The render thread owns the strip so a long show() never blocks HomeKit,
+        # frames are published to it without waiting
+        self._owns_render_thread = render_thread is None
+        if render_thread is None:
+            render_thread = RenderThread(name="{} render".format(self.display_name)).start()
+        self.render_thread = render_thread
+        self.render_output = render_thread.channel(self.neo_strip, self.display_name)
+
+        # Fades and effects are rendered once per frame of the clock
+        self._owns_frame_clock = frame_clock is None
+        self.frame_clock = frame_clock if frame_clock is not None else FrameClock(self.COLOR_FADE_FPS)
+        self.frame_clock.add(self.render_tick)
+        if self._owns_frame_clock:
+            self.frame_clock.register_metrics(self.display_name)
+        # Brightness, calibration and color order are applied by the frame buffer, not the driver
+        self.frame = FrameBuffer(LED_count, pixel_order, LED_brightness / 255,
+                                 calibration=Calibration.from_config(calibration), dither=dither_fps is not None)
+        self.dither_fps = dither_fps
 
         # Color Fade Mode
         # Current Mode
         if startup_in_color_fade_mode:
-            self.mode = 0x01  # Mode0x00: Single Color, Mode0x01: Color Fade
+            self.mode = 0x01  # Mode0x00: Single Color, Mode0x01: Color Fade, Mode0x02: Effect, Mode0x03: Show
         else:
             self.mode = 0x00
+        self.color_fade = ColorFade(self.COLOR_FADE_TRANSITION_LENGTH)
         self.color_fade_direction = 0x00  # 0=FWD  1=REV ie start_color to end_color
+
+        # Effect Mode
+        self.effect_name = self.EFFECT
+        self.effect_params = {}  # Extra effects params, color and color2 come from HomeKit
+        self._first_effect = (self.effect_name, self.effect_params)  # Effect mode was entered with this one
+        self.effect_start_time = time.monotonic()
+        # The worker process draws the effect into shared memory, we only send it parameter changes
+        self.effect_worker = None
+        if effect_worker:
+            from shared_framebuffer import EffectWorker
+            self.effect_worker = EffectWorker(LED_count, fps=self.EFFECT_FPS).start()
+        # Realtime Mode - network frames take over the strip while they keep coming
+        self.realtime = None
+        if realtime_port is not None:
+            from realtime_ingest import RealtimeReceiver
+            self.realtime = RealtimeReceiver(LED_count, self.realtime_frame, realtime_port, realtime_universe)
+        self._realtime_showing = False
+
+        # Recorded Show Mode - frames come straight out of the memory mapped file
+        self.show = None
+        if show_file is not None:
+            from recorded_show import RecordedShow
+            self.show = RecordedShow(show_file)
+            if self.show.LED_count != LED_count or self.show.pixel_order != pixel_order:
+                raise ValueError("{} was recorded for {} {} LEDs, this strip is {} {}".format(
+                    show_file, self.show.LED_count, self.show.pixel_order, LED_count, pixel_order))
+        self.show_start_time = time.monotonic()
+        self._show_wire = np.frombuffer(self.frame.wire_bytes, dtype=np.uint8)
+        self.recorder = None
         self.mode_timer = time.time()
         self.mode_counter = 0
         self.color_fade_ready_timer = time.time()
-        self.color_fade_colors = ColorFadeColors(NeoPixelColor.red(), NeoPixelColor.blue(), NeoPixelColor.red())
+        self.color_fade_colors = ColorFadeColors(NeoPixelColor.from_color(NeoPixelColor.red()),
+                                                 NeoPixelColor.from_color(NeoPixelColor.blue()),
+                                                 NeoPixelColor.from_color(NeoPixelColor.red()))
         self.color_fade_colors.print_hex_memory_ids()
+        self.restart_color_fade()
         self.old_time = time.time()
         self.wasBrightness = 0
 
+        # Flashes and other timed sequences run on the driver's event loop
+        self.effect_scheduler = EffectScheduler(self.driver.loop)
+        # Flashes are drawn over the frame so the mode underneath keeps running - See frame_layers.py
+        self.flash_layer = self.frame.add_layer("flash")
+        # Setters only record the new state, one frame is rendered per window
+        self.frame_coalescer = FrameCoalescer(self.driver.loop, self.render_current_state,
+                                              self.FRAME_COALESCE_WINDOW)
+        self._register_metrics()
+
+        # Fast boot - the entry script may have lit the strip from the snapshot already
+        self.snapshot_writer = None
+        if snapshot_file is not None:
+            snapshot = load_snapshot(snapshot_file)
+            if snapshot is not None:
+                self.restore_snapshot(snapshot)
+                self.frame_coalescer.request()
+            self.snapshot_writer = SnapshotWriter(snapshot_file, self.driver.loop, self.snapshot)
+
         temp = 0
         if self.color_fade_direction == 0x01:
             temp = 1
@@ -346,8 +510,78 @@ class NeoPixelLightStrip_Fader(Accessory):
         print("Color fade direction: {}".format(temp))
         print("NAME: {}".format(self.display_name))
 
+    def _register_metrics(self):
+        """Adds this strip's frame counters to the metrics - Setters are timed by timed_setter"""
+        name = self.display_name
+        METRICS.counter("jlights_frames_skipped_total", "Frames not pushed because nothing changed",
+                        lambda: self.frame.frames_skipped, strip=name)
+        METRICS.counter("jlights_coalesce_requests_total", "Frames asked for by HomeKit writes",
+                        lambda: self.frame_coalescer.requests, strip=name)
+        METRICS.counter("jlights_coalesce_renders_total", "Frames rendered for HomeKit writes after coalescing",
+                        lambda: self.frame_coalescer.renders, strip=name)
+
+    async def stop(self):
+        """Called by the driver on shutdown - Lets the render thread finish the last frame"""
+        if self._owns_render_thread:
+            self.render_thread.stop()
+        if self.effect_worker is not None:
+            self.effect_worker.stop()
+        if self.realtime is not None:
+            self.realtime.stop()
+        self.stop_recording()
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.flush()
+        await super().stop()
+
+    def snapshot(self):
+        """The state restored at the next start up - See fast_boot"""
+        primary = self.color_fade_colors.get_primary_color()
+        if self.mode == 0x01:
+            shown_rgb = self.color_fade.rgb_at(time.monotonic())
+        elif self.mode == 0x00:
+            shown_rgb = self.color_fade_colors.get_current_pixel_color().get_rgb()
+        else:
+            shown_rgb = primary.get_rgb()  # Effects and shows start up in the primary color until they render
+        fade_elapsed = (time.monotonic() - self.color_fade.start_time) % (2 * self.color_fade.transition_length)
+        secondary = self.color_fade_colors.get_secondary_color()
+        return Snapshot(self.accessory_state, self.mode, self.color_fade_direction, primary.get_hsv(),
+                        secondary.get_hsv(), fade_elapsed, tuple(int(value) for value in shown_rgb),
+                        int(round(primary.get_mired() or 0)), int(round(secondary.get_mired() or 0)))
+
+    def restore_snapshot(self, snapshot):
+        """Puts the strip back in the state of a snapshot and tells HomeKit about it"""
+        self.accessory_state = snapshot.accessory_state
+        self.mode = snapshot.mode if snapshot.mode < self.MODE_COUNT else 0x00
+        if self.mode == 0x03 and self.show is None:
+            self.mode = 0x00
+        for color, hsv, mired in ((self.color_fade_colors.get_primary_color(), snapshot.primary_hsv,
+                                   snapshot.primary_mired),
+                                  (self.color_fade_colors.get_secondary_color(), snapshot.secondary_hsv,
+                                   snapshot.secondary_mired)):
+            if mired:
+                color.set_color_with_mired(mired, hsv[2])
+            else:
+                color.set_color_with_hsv(*hsv)
+        self.color_fade_colors.get_current_pixel_color().set_color_with_rgb(*snapshot.rgb)
+        # Carry on the color fade from where it was
+        self.color_fade.set_colors(self.color_fade_colors.get_primary_color().get_rgb_fine(),
+                                   self.color_fade_colors.get_secondary_color().get_rgb_fine())
+        self.color_fade.start_time = time.monotonic() - snapshot.color_fade_elapsed
+        self.color_fade_direction = self.color_fade.direction = snapshot.color_fade_direction
+
+        hue, saturation, brightness = snapshot.primary_hsv
+        serv_light = self.get_service('Lightbulb')
+        serv_light.get_characteristic('On').set_value(snapshot.accessory_state, should_notify=False)
+        serv_light.get_characteristic('Hue').set_value(hue, should_notify=False)
+        serv_light.get_characteristic('Saturation').set_value(saturation, should_notify=False)
+        serv_light.get_characteristic('Brightness').set_value(brightness, should_notify=False)
+        if snapshot.primary_mired:
+            serv_light.get_characteristic('ColorTemperature').set_value(snapshot.primary_mired, should_notify=False)
+
+    @timed_setter
     def state_changed(self, value):
-        print("state_changed")
+        TRACE.record("setter", self.display_name, "state_changed", value)
+        self.effect_scheduler.cancel()  # A new command stops any flash still running
         self.accessory_state = value
 
         if value == 1:  # On
@@ -355,83 +589,236 @@ class NeoPixelLightStrip_Fader(Accessory):
                 if 1 < time.time() - self.mode_timer < 5:
                     self.mode_counter += 1
                     # print("Counter: {}  deltaTime: {}".format(self.mode_counter, self.mode_timer))
-                    if self.mode_counter == 2:
-                        self.mode ^= 1
+                    if self.mode_counter == 2 and self.mode == 0x02 and self.next_effect():
+                        # In effect mode the gesture steps through the effects before the next mode
+                        TRACE.record("effect", self.display_name, self.effect_name)
+                        self.mode_counter = 0
+                        self.flash_pixels(1, 0.5, NeoPixelColor.blue())  # One blue flash for the next effect
+                    elif self.mode_counter == 2:
+                        self.mode = (self.mode + 1) % self.MODE_COUNT
+                        if self.mode == 0x03 and self.show is None:
+                            self.mode = 0x00  # No show to play
+                        TRACE.record("mode", self.display_name, self.mode)
                         # print("Changing Mode To: {}".format(self.mode))
                         self.mode_counter = 0
                         if self.mode == 0x00:
-                            self.flash_pixels(3, 0.5, NeoPixelColor.red())  # White indicates single color mode
+                            self.flash_pixels(3, 0.5, NeoPixelColor.red())  # Red indicates single color mode
+                        elif self.mode == 0x01:
+                            self.flash_pixels(3, 0.5, NeoPixelColor.green())  # Green indicates color fade mode
+                        elif self.mode == 0x02:
+                            self.flash_pixels(3, 0.5, NeoPixelColor.blue())  # Blue indicates effect mode
+                            self.effect_start_time = time.monotonic()
+                            self._first_effect = (self.effect_name, self.effect_params)
                         else:
-                            self.flash_pixels(3, 0.5, NeoPixelColor.green())  # Blue indicates color fade mode
+                            self.flash_pixels(3, 0.5, NeoPixelColor.white())  # White indicates show mode
+                            self.show_start_time = time.monotonic()
                 else:
                     self.mode_counter = 0
             # Turn on our lights with the primary color and update the current color to the primary color
-            self.update_neopixel_with_color(self.color_fade_colors.get_primary_color())
-            color = self.color_fade_colors.get_primary_color()
-            rgb_tuple = color.get_rgb()
-            self.color_fade_colors.get_current_pixel_color().set_color_with_rgb(rgb_tuple[0], rgb_tuple[1],
-                                                                                rgb_tuple[2])
+            self.color_fade_colors.set_current_pixel_color(self.color_fade_colors.get_primary_color())
+            self.restart_color_fade()
 
         else:
-            self.update_neopixel_with_color(NeoPixelColor.black())  # Off
-            self.color_fade_direction = 0x00  # Reset our color fade direction for next power on
+            self.restart_color_fade()  # Reset our color fade direction for next power on
+
+        self.frame_coalescer.request()
 
         self.mode_timer = time.time()
 
         self.wasBrightness = 0  # Reset our hack to 0
 
-    # Lets check if we should update our color
-    @Accessory.run_at_interval(COLOR_FADE_INTERVAL)
-    def run(self):
-        if self.accessory_state == 1 and self.mode == 0x01:
-            # print("----- Start Loop ----")
-            start_color = self.color_fade_colors.get_primary_color()
-            end_color = self.color_fade_colors.get_secondary_color()
-            current_color = self.color_fade_colors.get_current_pixel_color()
-
-            # Fade Calculation
-            TRANSITION_LENGTH = 60 * 10  # seconds
-            if self.color_fade_direction == 0x00:
-                delta_hue = end_color.get_hue() - start_color.get_hue()
-                delta_sat = end_color.get_saturation() - start_color.get_saturation()
+    async def run(self):
+        """Renders the color fade at COLOR_FADE_FPS, or dither_fps when dithering, or the effect at
+        EFFECT_FPS until the driver stops
+        When the strip is on a shared frame clock the clock owner runs it instead"""
+        if self.realtime is not None:
+            await self.realtime.start(self.driver.loop)
+        if not self._owns_frame_clock:
+            return
+        await self.frame_clock.run(self.driver.aio_stop_event)
+
+    def render_tick(self, now):
+        """Renders one frame of the current mode for time now - Called by the frame clock"""
+        if self.realtime is not None and self.realtime_tick(now):
+            pass  # Network frames are shown as they arrive - See realtime_frame
+        elif self.mode == 0x02:
+            self.effect_tick(now)
+        elif self.mode == 0x03:
+            self.show_tick(now)
+        else:
+            self.color_fade_tick(now)
+
+        effect_showing = self.mode == 0x02 and self.accessory_state == 1 and not self._realtime_showing
+        if self.effect_worker is not None and not effect_showing:
+            self.effect_worker.update(self._EFFECT_WORKER_PAUSED)
+
+        if self._owns_frame_clock:
+            if self.mode == 0x02:
+                self.frame_clock.fps = self.EFFECT_FPS
+            elif self.mode == 0x03:
+                self.frame_clock.fps = self.show.fps
+            elif self.dither_fps is not None:
+                self.frame_clock.fps = self.dither_fps
             else:
-                delta_hue = start_color.get_hue() - end_color.get_hue()
-                delta_sat = start_color.get_saturation() - end_color.get_saturation()
-
-            hue_change_value = delta_hue / TRANSITION_LENGTH * self.COLOR_FADE_INTERVAL
-            sat_change_value = delta_sat / TRANSITION_LENGTH * self.COLOR_FADE_INTERVAL
+                self.frame_clock.fps = self.COLOR_FADE_FPS
 
-            current_color.adj_hue(hue_change_value)
-            current_color.adj_saturation(sat_change_value)
-
-            # Determine Direction of fade
-            if self.color_fade_direction == 0x00:
-                if current_color.is_equal_with(end_color):
-                    self.color_fade_direction ^= 1  # Flip the direction
-            elif self.color_fade_direction == 0x01:
-                if current_color.is_equal_with(start_color):
-                    self.color_fade_direction ^= 1
+    def color_fade_tick(self, now):
+        """Renders one color fade frame for time now"""
+        if self.accessory_state == 1 and self.mode == 0x01:
+            self.show_color_fade(now)
+            if self.color_fade.direction != self.color_fade_direction:
+                TRACE.record("fade_direction", self.display_name, self.color_fade.direction)
+                if self.snapshot_writer is not None:
+                    self.snapshot_writer.request()
+            self.color_fade_direction = self.color_fade.direction
+        elif self.frame.dither and self.accessory_state == 1 and self.mode == 0x00:
+            # A color between two 8bit steps is only right averaged over frames, keep dithering it
+            self.update_neopixel_with_color(self.color_fade_colors.get_current_pixel_color())
+
+    def show_color_fade(self, now):
+        """Shows the color fade at time now - One index into the precomputed fade curve"""
+        if self.frame.dither:
+            red, green, blue = self.color_fade.rgb_fine_at(now)
+        else:
+            red, green, blue = self.color_fade.rgb_at(now)
+        self.frame.fill(red, green, blue)
+        self.frame.show(self.render_output)
+
+    def effect_tick(self, now):
+        """Renders one frame of the current effect for time now"""
+        if self.accessory_state != 1:
+            return
+        primary = self.color_fade_colors.get_primary_color()
+        secondary = self.color_fade_colors.get_secondary_color()
+        # Effects run at full brightness, HomeKit brightness is applied to the whole frame after
+        params = {"color": hsv_to_rgb(primary.get_hue(), primary.get_saturation(), 100),
+                  "color2": hsv_to_rgb(secondary.get_hue(), secondary.get_saturation(), 100)}
+        params.update(self.effect_params)
+        brightness = int(primary.get_hsv()[2] + 0.5)
+
+        if self.effect_worker is not None:
+            self.effect_worker.update({"effect": self.effect_name, "params": params, "start_time": self.effect_start_time,
+                                       "brightness": brightness, "on": True})
+            if self.effect_worker.frame.sequence:  # Nothing to show until the worker draws its first frame
+                self.effect_worker.frame.read(self.frame.render)
+                self.frame.push(self.render_output)
+            return
+
+        pixels = self.frame.pixels
+        EFFECTS[self.effect_name](now - self.effect_start_time, self.LED_count, params, pixels)
+        np.take(V_SCALE[brightness], pixels, out=pixels)
+        self.frame.show(self.render_output)
+
+    def realtime_tick(self, now):
+        """Returns True while network frames own the strip
+        Puts the HomeKit color back once they stop for RealtimeReceiver.TIMEOUT"""
+        if self.realtime.active(now):
+            self._realtime_showing = True
+        elif self._realtime_showing:
+            self._realtime_showing = False
+            self.frame_coalescer.request()
+        return self._realtime_showing
+
+    def realtime_frame(self):
+        """Shows the frame the realtime receiver just completed
+        HomeKit on/off and brightness still apply, scaled over the whole frame in one lookup"""
+        if self.accessory_state != 1:
+            return
+        brightness = int(self.color_fade_colors.get_primary_color().get_hsv()[2] + 0.5)
+        np.take(V_SCALE[brightness], self.realtime.pixels, out=self.frame.pixels)
+        self.frame.show(self.render_output)
+
+    def show_tick(self, now):
+        """Pushes the frame of the recorded show for time now, the show loops
+        Show frames are already wire bytes and skip the overlay layers, the show waits while one is shown"""
+        if self.accessory_state != 1:
+            return
+        if self.flash_layer.shown:
+            self.frame.show(self.render_output)
+            return
+        pixels = self.show.frame_at(now - self.show_start_time)
+        brightness = int(self.color_fade_colors.get_primary_color().get_hsv()[2] + 0.5)
+        if brightness == 100:
+            self._show_wire[:] = pixels
+        else:
+            np.take(V_SCALE[brightness], pixels, out=self._show_wire)
+        self.frame.push(self.render_output)
+
+    def start_recording(self, path):
+        """Records every frame pushed to the strip into a show file until stop_recording"""
+        self.stop_recording()
+        from recorded_show import ShowRecorder
+        fps = self.EFFECT_FPS if self.mode == 0x02 else self.frame_clock.fps
+        self.recorder = ShowRecorder(path, self.LED_count, self.frame.pixel_order, self.render_output.output, fps)
+        self.render_output.output = self.recorder
+        self.frame.push(self.render_output, force=True)  # Start the show with the current frame
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+        self.render_output.output = self.recorder.output
+        self.recorder.close()
+        self.recorder = None
+
+    def set_effect(self, effect_name, **params):
+        """Selects the effect used in effect mode - See effects.EFFECTS for the names"""
+        if effect_name not in EFFECTS:
+            raise ValueError("Unknown effect {} - See effects.EFFECTS".format(effect_name))
+        self.effect_name = effect_name
+        self.effect_params = params
+        self.effect_start_time = time.monotonic()
+
+    def next_effect(self):
+        """Selects the next effect in effects.EFFECTS for the HomeKit mode gesture
+        Returns False once every effect has been shown, the strip is put back on the effect that effect
+        mode started with (and its params) so the gesture can move on to the next mode"""
+        names = list(EFFECTS)
+        next_name = names[(names.index(self.effect_name) + 1) % len(names)]
+        if next_name == self._first_effect[0]:
+            self.set_effect(self._first_effect[0], **self._first_effect[1])
+            return False
+        self.set_effect(next_name)
+        return True
+
+    def restart_color_fade(self):
+        """Starts the color fade again from the primary color
+        The fade curve is only rebuilt by the next fade frame, not in the setter"""
+        self.color_fade.set_colors(self.color_fade_colors.get_primary_color().get_rgb_fine(),
+                                   self.color_fade_colors.get_secondary_color().get_rgb_fine())
+        self.color_fade.restart(time.monotonic())
+        self.color_fade_direction = self.color_fade.direction
+
+    @timed_setter
+    def hue_changed(self, value):
+        TRACE.record("setter", self.display_name, "hue_changed", value)
+        self.effect_scheduler.cancel()
+        # This function moves the old primary to secondary and sets the new hue on primary
+        self.color_fade_colors.insert_new_hue(value)
 
-            self.update_neopixel_with_color(current_color)
+        if self.accessory_state == 1:
+            self.color_fade_colors.set_current_pixel_color(self.color_fade_colors.get_primary_color())
+            self.frame_coalescer.request()
 
-    def hue_changed(self, value):
-        print("Hue_change")  # TODO: - REMOVE
-        old_color = self.color_fade_colors.get_primary_color()
-        new_color = NeoPixelColor.from_color(old_color)
+        # Our color has changed so we must update reset our direction
+        self.restart_color_fade()
 
-        new_color.set_hue(value)
-        self.color_fade_colors.insert_new_color(
-            new_color)  # This function moves the old primary to secondary and replaces primary with new
+    @timed_setter
+    def temperature_changed(self, value):
+        TRACE.record("setter", self.display_name, "temperature_changed", value)
+        self.effect_scheduler.cancel()
+        # Same as a hue change, the old primary becomes the secondary so whites fade into each other
+        self.color_fade_colors.insert_new_mired(value)
 
         if self.accessory_state == 1:
-            self.update_neopixel_with_color(self.color_fade_colors.get_primary_color())
             self.color_fade_colors.set_current_pixel_color(self.color_fade_colors.get_primary_color())
+            self.frame_coalescer.request()
 
-        # Our color has changed so we must update reset our direction
-        self.color_fade_direction = 0x00
+        self.restart_color_fade()
 
+    @timed_setter
     def brightness_changed(self, value):
-        print("---brightness_changed---")  # TODO: - REMOVE
+        TRACE.record("setter", self.display_name, "brightness_changed", value)
+        self.effect_scheduler.cancel()
         self.wasBrightness = 1  # Hack for Appkit API brightness changing state
         pri = self.color_fade_colors.get_primary_color()
         sec = self.color_fade_colors.get_secondary_color()
@@ -440,11 +827,13 @@ class NeoPixelLightStrip_Fader(Accessory):
         sec.set_brightness(value)
 
         if self.accessory_state == 1:
-            self.update_neopixel_with_color(pri)
             self.color_fade_colors.set_current_pixel_color(pri)
+            self.restart_color_fade()
+            self.frame_coalescer.request()
 
+    @timed_setter
     def saturation_changed(self, value):
-        print("---saturation_changed---")  # TODO: - REMOVE
+        TRACE.record("setter", self.display_name, "saturation_changed", value)
         """ Saturation is never called on its own and always followed by hue
             Because of this we will update the primary
             saturation value only and let the hue call handel the final
@@ -453,23 +842,56 @@ class NeoPixelLightStrip_Fader(Accessory):
 
         pri.set_saturation(value)
 
+    def render_current_state(self):
+        """Pushes the current color, or black when off, to the strip
+        Called once per coalescing window after HomeKit writes, also saves the new state"""
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.request()
+        self.show_current_state()
+
+    def show_current_state(self):
+        """Pushes the frame of the current state without saving it, ie when only an overlay layer changed"""
+        if self.accessory_state == 1 and self.realtime is not None and self.realtime.active(time.monotonic()):
+            self.realtime_frame()  # Re-scale the last network frame to the new brightness
+        elif self.accessory_state == 1 and self.mode == 0x02:
+            self.effect_tick(time.monotonic())
+        elif self.accessory_state == 1 and self.mode == 0x03:
+            self.show_tick(time.monotonic())
+        elif self.accessory_state == 1 and self.mode == 0x01:
+            self.show_color_fade(time.monotonic())
+        elif self.accessory_state == 1:
+            self.update_neopixel_with_color(self.color_fade_colors.get_current_pixel_color())
+        else:
+            self.update_neopixel_with_color(NeoPixelColor.black())
+
     def update_neopixel_with_color(self, color):
-        rgb_tuple = color.get_rgb()
-        for i in range(self.LED_count):
-            if self.is_GRB:
-                self.neo_strip.setPixelColor(i, Color(int(rgb_tuple[1]),
-                                                      int(rgb_tuple[0]),
-                                                      int(rgb_tuple[2])))
-            else:
-                self.neo_strip.setPixelColor(i, Color(int(rgb_tuple[0]),
-                                                      int(rgb_tuple[1]),
-                                                      int(rgb_tuple[2])))
-        self.neo_strip.show()
+        if self.frame.dither:
+            rgb_tuple = color.get_rgb_fine()  # Keeps the brightness between 8bit steps
+        else:
+            rgb_tuple = color.get_rgb()
+        self.frame.fill(rgb_tuple[0], rgb_tuple[1], rgb_tuple[2])
+        self.frame.show(self.render_output)
 
     def flash_pixels(self, number_of_flashes, delay_between_flashes_seconds, flash_color):
-        # Note: - Flashing does not work yet because I dont know how to thread
-        for x in range(number_of_flashes):
-            self.update_neopixel_with_color(NeoPixelColor.black())
-            time.sleep(delay_between_flashes_seconds)
-            self.update_neopixel_with_color(flash_color)
-            time.sleep(delay_between_flashes_seconds)
\ No newline at end of file
+        """Flashes the strip without blocking the HomeKit event loop
+        The flash runs as a sequence on the effect scheduler and is cancelled by the next command
+        It is drawn on the flash layer, the current mode carries on underneath"""
+        self.effect_scheduler.start(self._flash_pixels_sequence(number_of_flashes, delay_between_flashes_seconds,
+                                                                flash_color))
+
+    async def _flash_pixels_sequence(self, number_of_flashes, delay_between_flashes_seconds, flash_color):
+        # The flash only changes the layer, not the state, so nothing here saves a snapshot
+        TRACE.record("layer", self.display_name, self.flash_layer.name, flash_color.get_rgb())
+        try:
+            for x in range(number_of_flashes):
+                self.flash_layer.fill(0, 0, 0)
+                self.show_current_state()
+                await asyncio.sleep(delay_between_flashes_seconds)
+                self.flash_layer.fill(*flash_color.get_rgb())
+                self.show_current_state()
+                await asyncio.sleep(delay_between_flashes_seconds)
+        finally:
+            # Uncover the strip, also when the next command cancels the flash
+            self.flash_layer.clear()
+            TRACE.record("layer", self.display_name, self.flash_layer.name, "clear")
+            self.show_current_state()
@@ -0,0 +1,163 @@
+"""
+Microbenchmark for NeoPixelColor and ColorFadeColors
+ Compares the current __slots__/in place implementation against the original
+ dict based implementation that went through colorsys and allocated a new
+ color on every call
+
+ Run from the repo root
+     python3 benchmarks/color_benchmark.py
+"""
+
+import colorsys
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from NeoPixelLightStrip import NeoPixelColor, ColorFadeColors  # noqa: E402
+
+
+class LegacyNeoPixelColor:
+    """The original NeoPixelColor - kept here as the before measurement"""
+
+    def __init__(self):
+        self._red = 255
+        self._green = 0
+        self._blue = 0
+        self._hue = 0
+        self._saturation = 100
+        self._brightness = 100
+
+    @classmethod
+    def from_color(cls, color):
+        return_color = cls()
+        rgb_tuple = color.get_rgb()
+        return_color.set_color_with_rgb(rgb_tuple[0], rgb_tuple[1], rgb_tuple[2])
+        return return_color
+
+    @classmethod
+    def red(cls):
+        color = cls()
+        color.set_color_with_rgb(255, 0, 0)
+        return color
+
+    def get_rgb(self):
+        return self._red, self._green, self._blue
+
+    def set_color_with_rgb(self, red, green, blue):
+        self._red = red
+        self._green = green
+        self._blue = blue
+        hsv = colorsys.rgb_to_hsv(red / 255, green / 255, blue / 255)
+        self._hue = hsv[0] * 360
+        self._saturation = hsv[1] * 100
+        self._brightness = hsv[2] * 100
+
+    def set_hue(self, hue):
+        self._hue = hue
+        rgb = colorsys.hsv_to_rgb(self._hue / 360,
+                                  self._saturation / 100,
+                                  self._brightness / 100)
+        self._red = rgb[0] * 255
+        self._green = rgb[1] * 255
+        self._blue = rgb[2] * 255
+
+
+class LegacyColorFadeColors:
+
+    def __init__(self, color1, color2, color3):
+        self._primaryColor = color1
+        self._secondaryColor = color2
+        self._current_pixel_color = color3
+
+    def insert_new_color(self, color):
+        self._secondaryColor = self._primaryColor
+        self._primaryColor = color
+
+    def get_primary_color(self):
+        return self._primaryColor
+
+    def set_current_pixel_color(self, color):
+        self._current_pixel_color.set_color_with_rgb(color.get_rgb()[0],
+                                                     color.get_rgb()[1],
+                                                     color.get_rgb()[2])
+
+
+def legacy_hue_changed(colors, value):
+    new_color = LegacyNeoPixelColor.from_color(colors.get_primary_color())
+    new_color.set_hue(value)
+    colors.insert_new_color(new_color)
+    colors.set_current_pixel_color(colors.get_primary_color())
+
+
+def hue_changed(colors, value):
+    colors.insert_new_hue(value)
+    colors.set_current_pixel_color(colors.get_primary_color())
+
+
+def time_per_op(func, number=100000):
+    """Best of 5 runs in nanoseconds per call"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+
+
+def bytes_per_color(factory, count=10000):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    colors = [factory() for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    # Take off the list holding them
+    return (size - sys.getsizeof(colors)) / count
+
+
+def peak_bytes_per_call(func, count=1000):
+    """Average peak of memory allocated while inside a single call"""
+    func()  # Warm up anything cached
+    tracemalloc.start()
+    total = 0
+    for _ in range(count):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total / count
+
+
+def main():
+    legacy_colors = LegacyColorFadeColors(LegacyNeoPixelColor.red(), LegacyNeoPixelColor.red(),
+                                          LegacyNeoPixelColor.red())
+    colors = ColorFadeColors(NeoPixelColor.from_color(NeoPixelColor.red()),
+                             NeoPixelColor.from_color(NeoPixelColor.red()),
+                             NeoPixelColor.from_color(NeoPixelColor.red()))
+    legacy_red = LegacyNeoPixelColor.red()
+    red = NeoPixelColor.from_color(NeoPixelColor.red())
+
+    cases = [
+        ("memory per color (bytes)",
+         bytes_per_color(LegacyNeoPixelColor.red),
+         bytes_per_color(lambda: NeoPixelColor.from_color(NeoPixelColor.red()))),
+        ("predefined color red() (ns)",
+         time_per_op(LegacyNeoPixelColor.red),
+         time_per_op(NeoPixelColor.red)),
+        ("copy color (ns)",
+         time_per_op(lambda: legacy_colors.set_current_pixel_color(legacy_red)),
+         time_per_op(lambda: colors.set_current_pixel_color(red))),
+        ("hue_changed color path (ns)",
+         time_per_op(lambda: legacy_hue_changed(legacy_colors, 120)),
+         time_per_op(lambda: hue_changed(colors, 120))),
+        ("hue_changed peak bytes per call",
+         peak_bytes_per_call(lambda: legacy_hue_changed(legacy_colors, 120)),
+         peak_bytes_per_call(lambda: hue_changed(colors, 120))),
+    ]
+
+    print("{:<40}{:>12}{:>12}".format("", "before", "after"))
+    for name, before, after in cases:
+        print("{:<40}{:>12.1f}{:>12.1f}".format(name, before, after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark for the effects library
+ Times one frame of every effect on a long strip and checks it fits in the
+ frame budget for the target frame rate
+
+ Run from the repo root
+     python3 benchmarks/effects_benchmark.py [LED_count] [target_fps]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from effects import EFFECTS  # noqa: E402
+
+
+def time_per_frame(effect, LED_count, params, number=500):
+    """Best of 5 runs in seconds per frame"""
+    out = np.zeros((LED_count, 3), dtype=np.uint8)
+    frame_times = iter(np.arange(number * 5 + 1) / 60.0)
+    return min(timeit.repeat(lambda: effect(next(frame_times), LED_count, params, out),
+                             number=number, repeat=5)) / number
+
+
+def main():
+    LED_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    target_fps = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    params = {"color": (255, 120, 0), "color2": (0, 40, 255)}
+
+    print("{} LEDs - frame budget {:.2f}ms at {:g} FPS".format(LED_count, 1000 / target_fps, target_fps))
+    print("{:<12}{:>12}{:>12}{:>8}".format("effect", "ms/frame", "max FPS", ""))
+    all_ok = True
+    for name, effect in EFFECTS.items():
+        seconds = time_per_frame(effect, LED_count, params)
+        ok = 1 / seconds >= target_fps
+        all_ok = all_ok and ok
+        print("{:<12}{:>12.3f}{:>12.0f}{:>8}".format(name, seconds * 1000, 1 / seconds, "ok" if ok else "SLOW"))
+    return 0 if all_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Benchmark suite
+ Runs every benchmark against the simulated strip and writes the results as JSON
+ so runs can be compared to catch regressions before deploying to the Pi fleet.
+
+ Covers
+ - NeoPixelColor conversions and ColorFadeColors operations
+ - a color fade frame from the precomputed Oklab curve and rebuilding the curve
+ - hsv_to_rgb / hsv_to_rgbw, scalar and array, against colorsys
+ - update_neopixel_with_color at 10/144/600/2000 LEDs
+ - setter callback to frame latency for NeoPixelLightStrip_Fader
+ - one frame of every effect
+ - rendering a calibrated frame, 8bit and temporally dithered, at 10/144/600/2000 LEDs
+ - rendering a frame with 0, 1 and 3 shown overlay layers at 10/144/600/2000 LEDs
+ - reading an effect worker frame out of shared memory at 2000 LEDs
+ - sending a frame over DDP and E1.31 to localhost at 10/144/600/2000 LEDs
+ - taking in a realtime DDP and E1.31 frame, parse and render, at 10/144/600/2000 LEDs
+
+ Run from the repo root
+     python3 benchmarks/run_benchmarks.py --output results.json
+     python3 benchmarks/run_benchmarks.py --baseline results.json --tolerance 0.2
+
+ With --baseline any result more than tolerance slower than the baseline is
+ reported and the exit code is 1.
+"""
+
+import argparse
+import asyncio
+import colorsys
+import contextlib
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import time
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["JLIGHTS_OUTPUT"] = "sim"
+
+import pyhap.loader as loader  # noqa: E402
+
+from calibration import Calibration  # noqa: E402
+from color_conversion import hsv_to_rgb, hsv_to_rgbw, hsv_to_rgb_array, hsv_to_rgbw_array  # noqa: E402
+from effects import EFFECTS  # noqa: E402
+from fade_engine import ColorFade  # noqa: E402
+from frame_buffer import FrameBuffer  # noqa: E402
+from output_backends import DDPOutput, E131Output  # noqa: E402
+from NeoPixelLightStrip import NeoPixelColor, ColorFadeColors, NeoPixelLightStrip_Fader  # noqa: E402
+from shared_framebuffer import SharedFrameBuffer  # noqa: E402
+
+LED_COUNTS = (10, 144, 600, 2000)
+
+
+class BenchmarkDriver:
+    """The parts of AccessoryDriver an accessory uses, without starting the HAP server or advertising"""
+
+    def __init__(self, loop):
+        self.loader = loader.get_loader()
+        self.loop = loop
+        self.aio_stop_event = asyncio.Event()
+
+
+def ns_per_call(func, number=20000, repeat=5):
+    """Best of repeat runs in nanoseconds per call"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e9
+
+
+def make_fader(driver, LED_count):
+    with contextlib.redirect_stdout(io.StringIO()):
+        fader = NeoPixelLightStrip_Fader(False, LED_count, True, 18, 800000, 10, 255, False, driver, "Bench")
+    return fader
+
+
+def bench_colors(results):
+    red = NeoPixelColor.from_color(NeoPixelColor.red())
+    colors = ColorFadeColors(NeoPixelColor.from_color(NeoPixelColor.red()),
+                             NeoPixelColor.from_color(NeoPixelColor.blue()),
+                             NeoPixelColor.from_color(NeoPixelColor.red()))
+    results["color.from_rgb"] = ns_per_call(lambda: NeoPixelColor.from_rgb(10, 200, 30))
+    results["color.from_hsv"] = ns_per_call(lambda: NeoPixelColor.from_hsv(200, 50, 80))
+    results["color.from_color"] = ns_per_call(lambda: NeoPixelColor.from_color(red))
+    results["color.set_hue"] = ns_per_call(lambda: red.set_hue(120))
+    results["color.set_brightness"] = ns_per_call(lambda: red.set_brightness(50))
+    results["fade_colors.insert_new_hue"] = ns_per_call(lambda: colors.insert_new_hue(240))
+    results["fade_colors.set_current_pixel_color"] = ns_per_call(lambda: colors.set_current_pixel_color(red))
+
+
+def bench_color_fade(results):
+    fade = ColorFade(10)
+    fade.set_colors((255.0, 0.0, 0.0), (0.0, 0.0, 255.0))
+    results["fade.rgb_at"] = ns_per_call(lambda: fade.rgb_at(3.3))
+    results["fade.rgb_fine_at"] = ns_per_call(lambda: fade.rgb_fine_at(3.3))
+    results["fade.build_curve"] = ns_per_call(fade._build_curve, number=200)
+
+
+def bench_conversions(results):
+    results["hsv.colorsys_reference"] = ns_per_call(lambda: colorsys.hsv_to_rgb(200 / 360, 0.5, 0.8))
+    results["hsv.hsv_to_rgb"] = ns_per_call(lambda: hsv_to_rgb(200, 50, 80))
+    results["hsv.hsv_to_rgbw"] = ns_per_call(lambda: hsv_to_rgbw(200, 50, 80))
+    hue = np.linspace(0, 360, 1000)
+    results["hsv.hsv_to_rgb_array_1000"] = ns_per_call(lambda: hsv_to_rgb_array(hue, 50, 80), number=2000)
+    results["hsv.hsv_to_rgbw_array_1000"] = ns_per_call(lambda: hsv_to_rgbw_array(hue, 50, 80), number=2000)
+
+
+def bench_update_neopixel(results, driver):
+    colors = [NeoPixelColor.from_rgb(255, 0, 0), NeoPixelColor.from_rgb(0, 255, 0)]
+    for LED_count in LED_COUNTS:
+        fader = make_fader(driver, LED_count)
+        fader.neo_strip.model_transfer_time = False  # CPU cost only, wire time is reported separately
+        frame_colors = iter(colors * 20000)  # Alternate colors so no frame is skipped as unchanged
+        results["update_neopixel_with_color.{}".format(LED_count)] = ns_per_call(
+            lambda: fader.update_neopixel_with_color(next(frame_colors)), number=2000)
+        results["wire_time.{}".format(LED_count)] = fader.neo_strip.transfer_time * 1e9
+
+
+async def _setter_latency(fader, setter, values):
+    """Nanoseconds from calling the setter to the frame being written"""
+    strip = fader.neo_strip
+    call_times = []
+    frame_latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for value in values:
+            frames_before = strip.frames_written
+            start = time.perf_counter()
+            setter(value)
+            call_times.append(time.perf_counter() - start)
+            while strip.frames_written == frames_before:
+                await asyncio.sleep(0)
+            frame_latencies.append(time.perf_counter() - start)
+    return statistics.median(call_times) * 1e9, statistics.median(frame_latencies) * 1e9
+
+
+def bench_setter_latency(results, driver):
+    for LED_count in (144, 600):
+        fader = make_fader(driver, LED_count)
+        with contextlib.redirect_stdout(io.StringIO()):
+            fader.state_changed(1)
+        hues = [(i * 37) % 360 for i in range(50)]
+        call, frame = driver.loop.run_until_complete(_setter_latency(fader, fader.hue_changed, hues))
+        results["setter.hue_changed.call.{}".format(LED_count)] = call
+        results["setter.hue_changed.to_frame.{}".format(LED_count)] = frame
+
+
+def bench_effects(results):
+    params = {"color": (255, 120, 0), "color2": (0, 40, 255)}
+    out = np.zeros((1000, 3), dtype=np.uint8)
+    for name, effect in EFFECTS.items():
+        frame_times = iter(np.arange(20000) / 60.0)
+        results["effect.{}.1000".format(name)] = ns_per_call(
+            lambda: effect(next(frame_times), 1000, params, out), number=2000, repeat=3)
+
+
+def bench_dither(results):
+    for LED_count in LED_COUNTS:
+        for name, dither in (("8bit", False), ("dither", True)):
+            frame = FrameBuffer(LED_count, "GRB", calibration=Calibration(), dither=dither)
+            frame.fill(3.3, 1.7, 0.4)  # A color between 8bit steps, the case dithering is for
+            results["frame.render.{}.{}".format(name, LED_count)] = ns_per_call(frame.render, number=2000)
+
+
+def bench_layers(results):
+    for LED_count in LED_COUNTS:
+        frame = FrameBuffer(LED_count, "GRB")
+        frame.fill(255, 120, 0)
+        for layer_count in (0, 1, 3):
+            while len(frame.layers) < layer_count:
+                frame.add_layer().fill(0, 40, 255, alpha=0.5)
+            results["frame.render.{}_layers.{}".format(layer_count, LED_count)] = ns_per_call(
+                frame.render, number=2000)
+
+
+def bench_shared_frame(results):
+    shared = SharedFrameBuffer(2000, create=True)
+    try:
+        frame = FrameBuffer(2000, "GRB")
+        shared.publish()
+        results["shared_frame.read.2000"] = ns_per_call(lambda: shared.read(frame.render), number=2000)
+    finally:
+        shared.close()
+
+
+def bench_udp_output(results):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # Never read, the kernel drops what doesn't fit
+    sock.bind(("127.0.0.1", 0))
+    host, port = sock.getsockname()
+    try:
+        for LED_count in LED_COUNTS:
+            frame = np.random.default_rng(1).integers(0, 256, LED_count * 3, dtype=np.uint8).tobytes()
+            for name, output in (("ddp", DDPOutput(LED_count, "RGB", host, port)),
+                                 ("e131", E131Output(LED_count, "RGB", host, universe=1, port=port))):
+                results["udp_output.{}.{}".format(name, LED_count)] = ns_per_call(
+                    lambda: output.write(frame), number=200)
+                output.close()
+    finally:
+        sock.close()
+
+
+class _Capture:
+    """Socket that keeps the packets sent to it instead of sending them"""
+
+    def __init__(self):
+        self.packets = []
+
+    def send(self, packet):
+        self.packets.append(bytes(packet))
+
+
+def bench_realtime_ingest(results, driver):
+    for LED_count in LED_COUNTS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fader = NeoPixelLightStrip_Fader(False, LED_count, True, 18, 800000, 10, 255, False, driver, "Bench",
+                                             realtime_port=0)
+            fader.state_changed(1)
+        fader.neo_strip.model_transfer_time = False
+        receive = fader.realtime.datagram_received
+        for name, sender in (("ddp", DDPOutput(LED_count, "RGB", "127.0.0.1")),
+                             ("e131", E131Output(LED_count, "RGB", "127.0.0.1"))):
+            capture = _Capture()
+            sender._sock, sock = capture, sender._sock
+            sender.write(bytearray(range(256)) * (sender.frame_size // 256) + bytearray(sender.frame_size % 256))
+            sender._sock = sock
+            sender.close()
+
+            def frame():
+                for packet in capture.packets:
+                    receive(packet, None)
+            results["realtime_ingest.{}.{}".format(name, LED_count)] = ns_per_call(frame, number=500, repeat=3)
+        fader.render_thread.stop()
+
+
+def run_all():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    driver = BenchmarkDriver(loop)
+    results = {}
+    bench_colors(results)
+    bench_color_fade(results)
+    bench_conversions(results)
+    bench_update_neopixel(results, driver)
+    bench_setter_latency(results, driver)
+    bench_effects(results)
+    bench_dither(results)
+    bench_layers(results)
+    bench_shared_frame(results)
+    bench_udp_output(results)
+    bench_realtime_ingest(results, driver)
+    loop.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the names of results more than tolerance slower than the baseline"""
+    regressions = []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if old and value > old * (1 + tolerance):
+            regressions.append(name)
+            print("REGRESSION {}: {:.0f}ns -> {:.0f}ns ({:+.0%})".format(name, old, value, value / old - 1),
+                  file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="jlights benchmark suite")
+    parser.add_argument("--output", help="file to write the JSON results to, default stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slow down before failing - 0.2 = 20%%")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "unit": "ns",
+        },
+        "results": run_all(),
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if compare(report["results"], baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,8 @@ from pyhap.const import (CATEGORY_FAN,
                          CATEGORY_GARAGE_DOOR_OPENER,
                          CATEGORY_SENSOR)
 
+from color_conversion import hsv_to_rgb
+
 
 logging.basicConfig(level=logging.INFO, format="[%(module)s] %(message)s")
 
@@ -150,7 +152,7 @@ class NeoPixelLightStrip(Accessory):
         # otherwise update the hue value only
         if self.accessory_state == 1:
             self.hue = value
-            rgb_tuple = self.hsv_to_rgb(
+            rgb_tuple = hsv_to_rgb(
                 self.hue, self.saturation, self.brightness)
             if len(rgb_tuple) == 3:
                 self.update_neopixel_with_color(
@@ -170,44 +172,6 @@ class NeoPixelLightStrip(Accessory):
         self.neo_strip.fill((green, red, blue, 0))
         self.neo_strip.show()
 
-    def hsv_to_rgb(self, h, s, v):
-        """
-        This function takes
-         h - 0 - 360 Deg
-         s - 0 - 100 %
-         v - 0 - 100 %
-        """
-
-        hPri = h / 60
-        s = s / 100
-        v = v / 100
-
-        if s <= 0.0:
-            return int(0), int(0), int(0)
-
-        C = v * s  # Chroma
-        X = C * (1 - abs(hPri % 2 - 1))
-
-        RGB_Pri = [0.0, 0.0, 0.0]
-
-        if 0 <= hPri <= 1:
-            RGB_Pri = [C, X, 0]
-        elif 1 <= hPri <= 2:
-            RGB_Pri = [X, C, 0]
-        elif 2 <= hPri <= 3:
-            RGB_Pri = [0, C, X]
-        elif 3 <= hPri <= 4:
-            RGB_Pri = [0, X, C]
-        elif 4 <= hPri <= 5:
-            RGB_Pri = [X, 0, C]
-        elif 5 <= hPri <= 6:
-            RGB_Pri = [C, 0, X]
-        else:
-            RGB_Pri = [0, 0, 0]
-
-        m = v - C
-
-        return int((RGB_Pri[0] + m) * 255), int((RGB_Pri[1] + m) * 255), int((RGB_Pri[2] + m) * 255)
 
 def get_accessory(driver):
     """Call this method to get a standalone Accessory."""
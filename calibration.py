@@ -0,0 +1,84 @@
+"""
+Per strip color calibration
+ HomeKit colors are written to the LEDs as linear 8bit values, so the bottom of
+ a brightness fade jumps in big visible steps and strips from different batches
+ show the same color differently. Calibration corrects every channel with
+ gamma - perceived brightness to LED duty cycle, out = in ^ gamma
+ white_balance - scale per channel so full white looks white on this strip
+ max_milliamps - scales the whole strip down so full white stays under the
+                 power supply's current, with milliamps_per_channel per LED channel
+
+ All three are compiled into one 256 entry table per channel, together with the
+ strip's overall brightness, the frame buffer applies them in one vectorized
+ lookup per frame - See FrameBuffer.calibration
+
+ Channels are in RGB(W) order whatever the wire order of the strip is.
+ Tables are built without numpy so fast_boot can correct the boot color too.
+
+ Hub and accessory config
+     "calibration": {"gamma": 2.2, "white_balance": [1.0, 0.85, 0.7], "max_milliamps": 4000}
+"""
+
+DEFAULT_GAMMA = 2.2
+MILLIAMPS_PER_CHANNEL = 20  # WS2812 at full duty, SK6812 is about the same
+
+
+class Calibration:
+
+    def __init__(self, gamma=DEFAULT_GAMMA, white_balance=(1.0, 1.0, 1.0, 1.0), max_milliamps=None,
+                 milliamps_per_channel=MILLIAMPS_PER_CHANNEL):
+        """
+        gamma - one gamma for every channel or one per channel, a short list repeats its last entry
+                - Normal:2.2, 1.0 is off
+        white_balance - scale 0.0 - 1.0 per channel - Normal:no change
+        max_milliamps - current budget of the whole strip - Normal:None no limit
+        milliamps_per_channel - current of one LED channel at 255 - Normal:20
+        """
+        self.gamma = gamma
+        self.white_balance = tuple(white_balance)
+        self.max_milliamps = max_milliamps
+        self.milliamps_per_channel = milliamps_per_channel
+
+    @classmethod
+    def from_config(cls, config):
+        """Calibration from a config dict, a Calibration or None is returned as it is"""
+        if config is None or isinstance(config, Calibration):
+            return config
+        return cls(config.get("gamma", DEFAULT_GAMMA), config.get("white_balance", (1.0, 1.0, 1.0, 1.0)),
+                   config.get("max_milliamps"), config.get("milliamps_per_channel", MILLIAMPS_PER_CHANNEL))
+
+    def _channel_gamma(self, channel):
+        """A gamma list shorter than the channels, ie RGB gammas on an RGBW strip, repeats its last entry"""
+        if isinstance(self.gamma, (int, float)):
+            return self.gamma
+        if not self.gamma:
+            return DEFAULT_GAMMA
+        return self.gamma[min(channel, len(self.gamma) - 1)]
+
+    def _channel_white_balance(self, channel):
+        return self.white_balance[channel] if channel < len(self.white_balance) else 1.0
+
+    def current_scale(self, LED_count, channels):
+        """Scale that keeps a full white strip under max_milliamps"""
+        if self.max_milliamps is None:
+            return 1.0
+        full_white = LED_count * channels * self.milliamps_per_channel
+        return min(1.0, self.max_milliamps / full_white)
+
+    def curves(self, LED_count, channels, brightness=1.0, size=256):
+        """One curve of size floats per RGB(W) channel, entry i is the LED value 0.0 - 255.0
+        for the input i / (size - 1) of full scale - Finer than 8bit for dithering
+        brightness - the strip's overall brightness, folded into the same curves - Normal:1.0"""
+        scale = brightness * self.current_scale(LED_count, channels) * 255
+        curves = []
+        for channel in range(channels):
+            gamma = self._channel_gamma(channel)
+            channel_scale = min(scale * self._channel_white_balance(channel), 255.0)
+            curves.append([(index / (size - 1)) ** gamma * channel_scale for index in range(size)])
+        return curves
+
+    def tables(self, LED_count, channels, brightness=1.0):
+        """One 256 byte table per RGB(W) channel taking the HomeKit 8bit value to the LED value
+        brightness - the strip's overall brightness, folded into the same tables - Normal:1.0"""
+        return [bytes(int(value + 0.5) for value in curve)
+                for curve in self.curves(LED_count, channels, brightness)]
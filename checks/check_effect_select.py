@@ -0,0 +1,85 @@
+"""
+Check that HomeKit can select every effect
+ Drives NeoPixelLightStrip_Fader through the power gesture (off, on again within
+ 1 - 5 seconds, twice) on the simulated strip. In effect mode every gesture must
+ select the next effect in effects.EFFECTS, after the last one the strip goes
+ back to the effect it started with and moves on to the next mode.
+
+ Run from the repo root
+     python3 checks/check_effect_select.py
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["JLIGHTS_OUTPUT"] = "sim"
+
+import pyhap.loader as loader  # noqa: E402
+
+from effects import EFFECTS  # noqa: E402
+from NeoPixelLightStrip import NeoPixelLightStrip_Fader  # noqa: E402
+
+
+class CheckDriver:
+    """The parts of AccessoryDriver an accessory uses, without starting the HAP server"""
+
+    def __init__(self, loop):
+        self.loader = loader.get_loader()
+        self.loop = loop
+        self.aio_stop_event = asyncio.Event()
+
+
+def gesture(fader):
+    """Two quick off - on writes, as the Home app sends when the switch is flicked twice"""
+    for _ in range(2):
+        fader.mode_timer = time.time() - 2  # The last write was 2 seconds ago
+        fader.state_changed(1)
+
+
+async def check():
+    fader = NeoPixelLightStrip_Fader(False, 10, True, 18, 800000, 10, 255, False,
+                                     CheckDriver(asyncio.get_running_loop()), "Check")
+    fader.set_effect("gradient", speed=0.02)
+    fader.state_changed(1)
+    while fader.mode != 0x02:
+        gesture(fader)
+    errors = []
+    names = list(EFFECTS)
+    expected = names[names.index("gradient"):] + names[:names.index("gradient")]
+    seen = [fader.effect_name]
+    for _ in range(len(names) - 1):
+        gesture(fader)
+        seen.append(fader.effect_name)
+        if fader.mode != 0x02:
+            errors.append("left effect mode after {}".format(seen))
+            break
+    if seen != expected:
+        errors.append("effects {} selected, expected {}".format(seen, expected))
+
+    gesture(fader)
+    if fader.mode == 0x02:
+        errors.append("still in effect mode after the last effect")
+    if fader.effect_name != "gradient" or fader.effect_params != {"speed": 0.02}:
+        errors.append("effect {} {} after leaving effect mode, expected gradient".format(
+            fader.effect_name, fader.effect_params))
+    fader.effect_scheduler.cancel()
+    return errors
+
+
+def main():
+    with contextlib.redirect_stdout(io.StringIO()):
+        errors = asyncio.run(check())
+    for error in errors:
+        print("FAIL", error)
+    if not errors:
+        print("ok - every effect selected by the power gesture")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
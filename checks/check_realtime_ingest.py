@@ -0,0 +1,86 @@
+"""
+Check realtime frame ingest
+ Streams DDP and E1.31 frames from localhost to a NeoPixelLightStrip_Fader on
+ the simulated strip and checks every frame is taken in at the target frame
+ rate. The parse and render cost per frame is timed by benchmarks/run_benchmarks.py.
+
+ Run from the repo root
+     python3 checks/check_realtime_ingest.py [LED_count] [target_fps]
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["JLIGHTS_OUTPUT"] = "sim"
+
+import pyhap.loader as loader  # noqa: E402
+
+from output_backends import DDPOutput, E131Output  # noqa: E402
+from NeoPixelLightStrip import NeoPixelLightStrip_Fader  # noqa: E402
+
+
+class CheckDriver:
+    """The parts of AccessoryDriver an accessory uses, without starting the HAP server"""
+
+    def __init__(self, loop):
+        self.loader = loader.get_loader()
+        self.loop = loop
+        self.aio_stop_event = asyncio.Event()
+
+
+async def stream(sender, receiver, frames, fps):
+    """Sends frames at fps and returns how many the receiver completed"""
+    frame = bytearray(sender.frame_size)
+    before = receiver.frames_received
+    next_frame_time = time.monotonic()
+    for index in range(frames):
+        frame[:] = np.full(sender.frame_size, index % 256, dtype=np.uint8).tobytes()
+        sender.write(frame)
+        next_frame_time += 1 / fps
+        await asyncio.sleep(max(0.0, next_frame_time - time.monotonic()))
+    await asyncio.sleep(0.05)
+    return receiver.frames_received - before
+
+
+def main():
+    LED_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    target_fps = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    frames = int(target_fps * 2)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    with contextlib.redirect_stdout(io.StringIO()):
+        fader = NeoPixelLightStrip_Fader(False, LED_count, True, 18, 800000, 10, 255, False, CheckDriver(loop),
+                                         "Check", realtime_port=0)
+        fader.state_changed(1)
+    fader.neo_strip.model_transfer_time = False
+    loop.run_until_complete(fader.realtime.start(loop))
+    port = fader.realtime.port
+
+    errors = []
+    for name, sender in (("DDP", DDPOutput(LED_count, "RGB", "127.0.0.1", port)),
+                         ("E1.31", E131Output(LED_count, "RGB", "127.0.0.1", port=port))):
+        received = loop.run_until_complete(stream(sender, fader.realtime, frames, target_fps))
+        if received != frames:
+            errors.append("{} {} of {} frames taken in at {:g} FPS".format(name, received, frames, target_fps))
+        sender.close()
+
+    fader.realtime.stop()
+    fader.render_thread.stop()
+    loop.close()
+    for error in errors:
+        print("FAIL", error)
+    if not errors:
+        print("ok - every DDP and E1.31 frame of {} LEDs taken in at {:g} FPS".format(LED_count, target_fps))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Check the shared frame buffer seqlock
+ A frame the effect worker publishes while the strip's process is still
+ rendering the front slot must make SharedFrameBuffer.read render again from
+ the new front slot, and a worker that keeps publishing on every read must be
+ counted in torn_reads once the retries run out.
+
+ Run from the repo root
+     python3 checks/check_shared_framebuffer.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from shared_framebuffer import READ_RETRIES, SharedFrameBuffer  # noqa: E402
+
+
+def check(shared):
+    errors = []
+    calls = []
+
+    def publish_once(pixels):
+        calls.append(pixels)
+        if len(calls) == 1:
+            shared.publish()  # The worker publishes while the first read is still rendering
+
+    shared.read(publish_once)
+    if len(calls) != 2 or shared.torn_reads != 0:
+        errors.append("read {} times, {} torn reads with a publish mid read, expected 2 and 0".format(
+            len(calls), shared.torn_reads))
+    elif calls[0] is calls[1]:
+        errors.append("read the same slot again after a publish")
+
+    calls.clear()
+
+    def publish_always(pixels):
+        calls.append(pixels)
+        shared.publish()
+
+    shared.read(publish_always)
+    if len(calls) != READ_RETRIES or shared.torn_reads != 1:
+        errors.append("read {} times, {} torn reads with a publish on every read, expected {} and 1".format(
+            len(calls), shared.torn_reads, READ_RETRIES))
+    return errors
+
+
+def main():
+    shared = SharedFrameBuffer(10, create=True)
+    try:
+        errors = check(shared)
+    finally:
+        shared.close()
+    for error in errors:
+        print("FAIL", error)
+    if not errors:
+        print("ok - shared frame reads retry when the worker publishes mid read")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Check the DDP and E1.31 network outputs
+ Sends a frame to a UDP listener on localhost and checks the listener puts the
+ packets back together into the frame that was sent. The outputs are timed by
+ benchmarks/run_benchmarks.py.
+
+ Run from the repo root
+     python3 checks/check_udp_output.py [LED_count]
+"""
+
+import os
+import socket
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from output_backends import DDPOutput, E131Output  # noqa: E402
+
+
+def listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(1.0)
+    return sock
+
+
+def receive_ddp(sock, frame_size):
+    """Reads DDP packets until the push flag and returns the frame"""
+    frame = bytearray(frame_size)
+    while True:
+        packet = sock.recv(2048)
+        offset = int.from_bytes(packet[4:8], "big")
+        length = int.from_bytes(packet[8:10], "big")
+        frame[offset:offset + length] = packet[10:10 + length]
+        if packet[0] & DDPOutput.FLAG_PUSH:
+            return bytes(frame)
+
+
+def receive_e131(sock, output):
+    """Reads one packet per universe of the output and returns the frame, None for a packet that is not E1.31"""
+    universes = {}
+    for _ in output.universes:
+        packet = sock.recv(2048)
+        if packet[4:16] != b"ASC-E1.17\0\0\0":
+            return None
+        slots = int.from_bytes(packet[123:125], "big") - 1
+        universes[int.from_bytes(packet[113:115], "big")] = packet[126:126 + slots]
+    return b"".join(universes[universe] for universe in output.universes)
+
+
+def check(LED_count):
+    errors = []
+    frame = np.random.default_rng(1).integers(0, 256, LED_count * 3, dtype=np.uint8).tobytes()
+
+    sock = listener()
+    ddp = DDPOutput(LED_count, "RGB", *sock.getsockname())
+    ddp.write(frame)
+    if receive_ddp(sock, ddp.frame_size) != frame:
+        errors.append("DDP frame did not arrive as it was sent")
+    ddp.close()
+    sock.close()
+
+    sock = listener()
+    host, port = sock.getsockname()
+    e131 = E131Output(LED_count, "RGB", host, universe=1, port=port)
+    e131.write(frame)
+    if receive_e131(sock, e131) != frame:
+        errors.append("E1.31 frame did not arrive as it was sent")
+    e131.close()
+    sock.close()
+
+    for name, output in (("DDP", ddp), ("E1.31", e131)):
+        if output.send_errors:
+            errors.append("{} send errors {}".format(name, output.send_errors))
+    return errors
+
+
+def main():
+    LED_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    errors = check(LED_count)
+    for error in errors:
+        print("FAIL", error)
+    if not errors:
+        print("ok - DDP and E1.31 frames of {} LEDs arrive as sent".format(LED_count))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
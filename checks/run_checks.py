@@ -0,0 +1,27 @@
+"""
+Runs every check_*.py in this folder, the exit code is 1 when any of them fails
+
+ Run from the repo root
+     python3 checks/run_checks.py
+"""
+
+import glob
+import os
+import subprocess
+import sys
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    failed = []
+    for path in sorted(glob.glob(os.path.join(here, "check_*.py"))):
+        print("{}: ".format(os.path.basename(path)), end="", flush=True)
+        if subprocess.call([sys.executable, path]) != 0:
+            failed.append(os.path.basename(path))
+    if failed:
+        print("FAILED", " ".join(failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
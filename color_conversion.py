@@ -0,0 +1,257 @@
+"""
+HSV to RGB/RGBW conversion shared by all the NeoPixel accessories
+ Conversions are precomputed into lookup tables indexed by the integer
+ Apple HomeKit API ranges so converting a color is a couple of table lookups
+ instead of colorsys or hand rolled float math.
+
+ Apple Homekit API Values
+ Hue: 0 - 360
+ Saturation: 0 - 100
+ Brightness: 0 - 100
+
+ HSV to RGB is linear in brightness so the tables are split in two
+ HS_RGB - the 8bit RGB color at full brightness for every hue/saturation
+ V_SCALE - every 8bit channel value scaled by every brightness
+ which keeps the tables small instead of 11MB for the full 361x101x101 cube
+
+ RGBW white channel
+ HS_RGBW mixes every hue/saturation from the white LED and the RGB LEDs. As
+ much of the color as the white LED can make goes to it, the RGB LEDs add
+ what is left, so pastels and whites use the white LED and saturated colors
+ don't. The white LED is taken to be WHITE_LED_KELVIN, the RGB LEDs tint it
+ to the color asked for.
+ siri warm white, 100w tungston: h 31 s 33 v 100
+ siri cool white, cool florescent:h 208 s 17 v 100
+ siri white: h 0 s 0 v 100
+
+ Color temperature
+ HomeKit ColorTemperature is in mired (1000000 / Kelvin) 140 - 500, ie 7143K - 2000K
+ CT_RGB / CT_RGBW - the 8bit RGB and mixed RGBW color at full brightness for every
+                    mired, brightness is V_SCALE as for HSV
+ CT_HS - the hue/saturation closest to every mired for HomeKit and effects
+
+ Oklab
+ Perceptual color space (https://bottosson.github.io/posts/oklab/) the color
+ fade interpolates in, a straight line between two colors in Oklab keeps an
+ even brightness and doesn't go muddy half way like HSV or RGB do.
+ oklab_gradient builds a whole fade as one array
+"""
+
+import colorsys
+
+import numpy as np
+
+HUE_MAX = 360
+SATURATION_MAX = 100
+BRIGHTNESS_MAX = 100
+MIRED_MIN = 140
+MIRED_MAX = 500
+WHITE_LED_KELVIN = 4000  # SK6812 RGBW natural white, 3000 for warm white and 6500 for cool white strips
+
+
+def _build_hs_rgb_table():
+    hue = np.arange(HUE_MAX + 1, dtype=np.float64)[:, None]
+    saturation = np.arange(SATURATION_MAX + 1, dtype=np.float64)[None, :] / SATURATION_MAX
+
+    # Position of each channel relative to the hue, same result as colorsys.hsv_to_rgb
+    channel_offsets = np.array((5, 3, 1), dtype=np.float64)  # R, G, B in units of 60 Deg
+    k = (channel_offsets[None, :] + hue / 60) % 6  # (hue, channel)
+    sector = np.clip(np.minimum(k, 4 - k), 0, 1)
+    table = 1 - saturation[:, :, None] * sector[:, None, :]  # (hue, sat, channel)
+    return np.rint(table * 255).astype(np.uint8)
+
+
+def _build_v_scale_table():
+    brightness = np.arange(BRIGHTNESS_MAX + 1, dtype=np.float64)[:, None] / BRIGHTNESS_MAX
+    return np.rint(np.arange(256, dtype=np.float64)[None, :] * brightness).astype(np.uint8)
+
+
+def _kelvin_to_rgb(kelvin):
+    """Black body color 0.0 - 1.0 of each Kelvin, Tanner Helland's fit to the CIE 1964 table"""
+    t = np.asarray(kelvin, dtype=np.float64)[..., None] / 100
+    warm = t <= 66
+    red = np.where(warm, 255, 329.698727446 * np.maximum(t - 60, 1) ** -0.1332047592)
+    green = np.where(warm, 99.4708025861 * np.log(t) - 161.1195681661,
+                     288.1221695283 * np.maximum(t - 60, 1) ** -0.0755148492)
+    blue = np.where(t >= 66, 255, np.where(t <= 19, 0, 138.5177312231 * np.log(np.maximum(t - 10, 1)) - 305.0447927307))
+    return np.clip(np.concatenate((red, green, blue), axis=-1), 0, 255) / 255
+
+
+WHITE_LED_RGB = _kelvin_to_rgb(WHITE_LED_KELVIN)  # What the white LED looks like to the RGB LEDs
+
+
+def _mix_white(rgb):
+    """Splits (..., 3) RGB 0.0 - 1.0 into (..., 4) 8bit RGBW using the white LED for as much as it can
+    The result is scaled back up to full brightness"""
+    white = np.min(rgb / WHITE_LED_RGB, axis=-1, keepdims=True)
+    rgbw = np.concatenate((rgb - white * WHITE_LED_RGB, white), axis=-1)
+    peak = np.maximum(rgbw.max(axis=-1, keepdims=True), 1e-9)
+    return np.rint(rgbw / peak * 255).astype(np.uint8)
+
+
+def _build_ct_hs_table(ct_rgb):
+    hs = np.zeros((len(ct_rgb), 2))
+    for index, (red, green, blue) in enumerate(ct_rgb.tolist()):
+        hue, saturation, _ = colorsys.rgb_to_hsv(red / 255, green / 255, blue / 255)
+        hs[index] = hue * HUE_MAX, saturation * SATURATION_MAX
+    return hs
+
+
+HS_RGB = _build_hs_rgb_table()  # (361, 101, 3) uint8
+V_SCALE = _build_v_scale_table()  # (101, 256) uint8
+HS_RGBW = _mix_white(HS_RGB / 255)  # (361, 101, 4) uint8
+_CT_FLOAT = _kelvin_to_rgb(1000000 / np.arange(MIRED_MIN, MIRED_MAX + 1))
+CT_RGB = np.rint(_CT_FLOAT / _CT_FLOAT.max(axis=-1, keepdims=True) * 255).astype(np.uint8)  # (361, 3) uint8
+CT_RGBW = _mix_white(_CT_FLOAT)  # (361, 4) uint8
+CT_HS = _build_ct_hs_table(CT_RGB)  # (361, 2) float - hue, saturation
+
+# Python side copies for the scalar API - indexing tuples and bytes is much faster
+# than indexing numpy for a single color
+_HS_RGB_ROWS = [tuple(map(tuple, row.tolist())) for row in HS_RGB]  # [hue][sat] -> (r, g, b)
+_HS_RGBW_ROWS = [tuple(map(tuple, row.tolist())) for row in HS_RGBW]  # [hue][sat] -> (r, g, b, w)
+_V_SCALE_ROWS = [row.tobytes() for row in V_SCALE]
+_CT_RGB_ROWS = [tuple(row) for row in CT_RGB.tolist()]  # [mired - MIRED_MIN] -> (r, g, b)
+_CT_RGBW_ROWS = [tuple(row) for row in CT_RGBW.tolist()]
+_CT_HS_ROWS = [tuple(row) for row in CT_HS.tolist()]
+
+
+def hsv_to_rgb(hue, saturation, brightness):
+    """
+    This function takes
+     hue - 0 - 360 Deg
+     saturation - 0 - 100 %
+     brightness - 0 - 100 %
+    and returns 8bit red, green, blue
+    """
+    # Round to table indexes - hue wraps, saturation and brightness clamp
+    h = int(hue + 0.5) % HUE_MAX
+    s = int(saturation + 0.5)
+    v = int(brightness + 0.5)
+    if not (0 <= s <= SATURATION_MAX and 0 <= v <= BRIGHTNESS_MAX):
+        s = min(max(s, 0), SATURATION_MAX)
+        v = min(max(v, 0), BRIGHTNESS_MAX)
+
+    red, green, blue = _HS_RGB_ROWS[h][s]
+    scale = _V_SCALE_ROWS[v]
+    return scale[red], scale[green], scale[blue]
+
+
+def hsv_to_rgb_fine(hue, saturation, brightness):
+    """
+    Same as hsv_to_rgb without rounding the brightness
+    returns red, green, blue as floats 0.0 - 255.0 for dithered frame buffers
+    """
+    h = int(hue + 0.5) % HUE_MAX
+    s = min(max(int(saturation + 0.5), 0), SATURATION_MAX)
+    scale = min(max(brightness, 0), BRIGHTNESS_MAX) / BRIGHTNESS_MAX
+
+    red, green, blue = _HS_RGB_ROWS[h][s]
+    return red * scale, green * scale, blue * scale
+
+
+def hsv_to_rgbw(hue, saturation, brightness):
+    """
+    Same as hsv_to_rgb but also returns the 8bit white LED value
+    See HS_RGBW for how the white LED is mixed in
+    """
+    h = int(hue + 0.5) % HUE_MAX
+    s = int(saturation + 0.5)
+    v = int(brightness + 0.5)
+    if not (0 <= s <= SATURATION_MAX and 0 <= v <= BRIGHTNESS_MAX):
+        s = min(max(s, 0), SATURATION_MAX)
+        v = min(max(v, 0), BRIGHTNESS_MAX)
+
+    red, green, blue, white = _HS_RGBW_ROWS[h][s]
+    scale = _V_SCALE_ROWS[v]
+    return scale[red], scale[green], scale[blue], scale[white]
+
+
+def _mired_index(mired, brightness):
+    m = min(max(int(mired + 0.5), MIRED_MIN), MIRED_MAX) - MIRED_MIN
+    v = min(max(int(brightness + 0.5), 0), BRIGHTNESS_MAX)
+    return m, v
+
+
+def mired_to_rgb(mired, brightness):
+    """
+    This function takes
+     mired - HomeKit ColorTemperature 140 - 500
+     brightness - 0 - 100 %
+    and returns 8bit red, green, blue
+    """
+    m, v = _mired_index(mired, brightness)
+    red, green, blue = _CT_RGB_ROWS[m]
+    scale = _V_SCALE_ROWS[v]
+    return scale[red], scale[green], scale[blue]
+
+
+def mired_to_rgbw(mired, brightness):
+    """Same as mired_to_rgb but mixed with the white LED, returns 8bit red, green, blue, white"""
+    m, v = _mired_index(mired, brightness)
+    red, green, blue, white = _CT_RGBW_ROWS[m]
+    scale = _V_SCALE_ROWS[v]
+    return scale[red], scale[green], scale[blue], scale[white]
+
+
+def mired_to_rgb_fine(mired, brightness):
+    """Same as mired_to_rgb without rounding the brightness, floats 0.0 - 255.0 for dithering"""
+    red, green, blue = _CT_RGB_ROWS[_mired_index(mired, 0)[0]]
+    scale = min(max(brightness, 0), BRIGHTNESS_MAX) / BRIGHTNESS_MAX
+    return red * scale, green * scale, blue * scale
+
+
+def mired_to_hs(mired):
+    """The HomeKit hue, saturation closest to a color temperature"""
+    return _CT_HS_ROWS[_mired_index(mired, 0)[0]]
+
+
+def _hsv_array_index(hue, saturation, brightness):
+    hue, saturation, brightness = np.broadcast_arrays(hue, saturation, brightness)
+    h = np.rint(hue).astype(np.intp) % HUE_MAX
+    s = np.clip(np.rint(saturation), 0, SATURATION_MAX).astype(np.intp)
+    v = np.clip(np.rint(brightness), 0, BRIGHTNESS_MAX).astype(np.intp)
+    return h, s, v
+
+
+def hsv_to_rgb_array(hue, saturation, brightness):
+    """Vectorized hsv_to_rgb - takes arrays (or scalars) of HomeKit values
+    and returns a uint8 array of shape (..., 3)"""
+    h, s, v = _hsv_array_index(hue, saturation, brightness)
+    return V_SCALE[v[..., None], HS_RGB[h, s]]
+
+
+def hsv_to_rgbw_array(hue, saturation, brightness):
+    """Vectorized hsv_to_rgbw - returns a uint8 array of shape (..., 4)"""
+    h, s, v = _hsv_array_index(hue, saturation, brightness)
+    return V_SCALE[v[..., None], HS_RGBW[h, s]]
+
+
+_OKLAB_LMS = np.array(((0.4122214708, 0.5363325363, 0.0514459929),
+                       (0.2119034982, 0.6806995451, 0.1073969566),
+                       (0.0883024619, 0.2817188376, 0.6299787005)))
+_OKLAB_LAB = np.array(((0.2104542553, 0.7936177850, -0.0040720468),
+                       (1.9779984951, -2.4285922050, 0.4505937099),
+                       (0.0259040371, 0.7827717662, -0.8086757660)))
+_OKLAB_LMS_INVERSE = np.linalg.inv(_OKLAB_LMS)
+_OKLAB_LAB_INVERSE = np.linalg.inv(_OKLAB_LAB)
+
+
+def rgb_to_oklab(rgb):
+    """(..., 3) sRGB 0 - 255 to (..., 3) Oklab L, a, b"""
+    srgb = np.asarray(rgb, dtype=np.float64) / 255
+    linear = np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+    return np.cbrt(linear @ _OKLAB_LMS.T) @ _OKLAB_LAB.T
+
+
+def oklab_to_rgb(lab):
+    """(..., 3) Oklab L, a, b to (..., 3) float sRGB 0.0 - 255.0, colors outside sRGB are clipped"""
+    linear = np.clip(((np.asarray(lab) @ _OKLAB_LAB_INVERSE.T) ** 3) @ _OKLAB_LMS_INVERSE.T, 0, 1)
+    srgb = np.where(linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055)
+    return srgb * 255
+
+
+def oklab_gradient(start_rgb, end_rgb, steps):
+    """(steps, 3) float RGB 0.0 - 255.0 from start_rgb to end_rgb evenly spaced in Oklab"""
+    start, end = rgb_to_oklab((start_rgb, end_rgb))
+    position = np.linspace(0, 1, steps)[:, None]
+    return oklab_to_rgb(start + (end - start) * position)
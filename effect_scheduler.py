@@ -0,0 +1,69 @@
+"""
+Runs timed light sequences (flashes, mode change feedback etc.) as asyncio tasks
+ on the accessory driver's event loop so HomeKit setter callbacks never sleep.
+
+ Only one sequence runs per scheduler at a time, starting a new sequence or
+ calling cancel() stops whatever is still running. This is how a new HomeKit
+ command interrupts a flash that is still in progress.
+
+ pyhap calls setter callbacks on the event loop thread but runs plain
+ run() methods in an executor thread, so start() and cancel() can be called
+ from either.
+
+ Usage
+     scheduler = EffectScheduler(driver.loop)
+
+     async def blink():
+         strip_off()
+         await asyncio.sleep(0.5)
+         strip_on()
+
+     scheduler.start(blink())
+"""
+
+import asyncio
+
+
+class EffectScheduler:
+
+    def __init__(self, loop):
+        """loop - the event loop the sequences run on - Normal:driver.loop"""
+        self.loop = loop
+        self._task = None  # Only touched from the event loop thread
+
+    @property
+    def running(self):
+        """True while a sequence is scheduled or running"""
+        task = self._task
+        return task is not None and not task.done()
+
+    def start(self, coro):
+        """Cancels any running sequence and schedules coro in its place
+        Returns straight away, the sequence runs on the event loop"""
+        if self._in_loop_thread():
+            self._start(coro)
+        else:
+            self.loop.call_soon_threadsafe(self._start, coro)
+
+    def cancel(self):
+        """Stops the running sequence if there is one"""
+        if self._in_loop_thread():
+            self._cancel()
+        else:
+            self.loop.call_soon_threadsafe(self._cancel)
+
+    def _in_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _start(self, coro):
+        if self._task is not None:
+            self._task.cancel()
+        self._task = self.loop.create_task(coro)
+
+    def _cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,136 @@
+"""
+Light strip effects
+ Every effect computes a whole frame at once with NumPy array operations
+ from the time, the number of LEDs and a dict of parameters, there are no per
+ pixel python loops so an effect costs about the same on 1000 LEDs as on 10.
+
+ effect(t, LED_count, params, out)
+ t - seconds since the effect started
+ LED_count - the number of LEDs in the array
+ params - dict of effect parameters, anything missing uses the default
+ out - uint8 array of shape (LED_count, 3) the RGB frame is written into
+
+ Common params
+ color - (r, g, b) 0 - 255 main color of the effect - Normal:HomeKit primary color
+ color2 - (r, g, b) 0 - 255 second color for gradient - Normal:HomeKit secondary color
+ speed - how fast the effect moves, see each effect for the units
+
+ Effects are looked up by name in EFFECTS
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+DEFAULT_COLOR = (255, 0, 0)
+DEFAULT_COLOR2 = (0, 0, 255)
+
+
+def _build_wheel():
+    """Same color wheel as neopixel_test.wheel - r - g - b - back to r for positions 0 - 255"""
+    pos = np.arange(256)
+    wheel = np.zeros((256, 3), dtype=np.int64)
+    first = pos < 85
+    second = (pos >= 85) & (pos < 170)
+    third = pos >= 170
+    wheel[first] = np.stack((pos[first] * 3, 255 - pos[first] * 3, np.zeros(first.sum(), np.int64)), axis=1)
+    p = pos[second] - 85
+    wheel[second] = np.stack((255 - p * 3, np.zeros(len(p), np.int64), p * 3), axis=1)
+    p = pos[third] - 170
+    wheel[third] = np.stack((np.zeros(len(p), np.int64), p * 3, 255 - p * 3), axis=1)
+    return wheel.astype(np.uint8)
+
+
+WHEEL = _build_wheel()  # (256, 3) uint8
+
+
+@lru_cache(maxsize=16)
+def _pixel_index(LED_count):
+    index = np.arange(LED_count, dtype=np.int64)
+    index.flags.writeable = False
+    return index
+
+
+@lru_cache(maxsize=16)
+def _pixel_noise(LED_count, seed):
+    """Fixed pseudo random 0.0 - 1.0 per pixel"""
+    noise = np.random.default_rng(seed).random(LED_count)
+    noise.flags.writeable = False
+    return noise
+
+
+def _hash_noise(index, cycle):
+    """Pseudo random 0.0 - 1.0 for every (pixel, cycle) pair without keeping any state"""
+    x = np.sin(index * 12.9898 + cycle * 78.233) * 43758.5453
+    return x - np.floor(x)
+
+
+def rainbow(t, LED_count, params, out):
+    """The neopixel_test rainbow_cycle spread across the strip
+    speed - trips around the color wheel per second - Normal:0.2"""
+    speed = params.get("speed", 0.2)
+    offset = int(t * speed * 256)
+    positions = (_pixel_index(LED_count) * 256 // LED_count + offset) & 255
+    np.take(WHEEL, positions, axis=0, out=out)
+    return out
+
+
+def chase(t, LED_count, params, out):
+    """Blocks of color running along the strip
+    speed - pixels per second - Normal:20
+    width - lit pixels per block - Normal:3
+    spacing - pixels from the start of one block to the next - Normal:10"""
+    speed = params.get("speed", 20)
+    width = params.get("width", 3)
+    spacing = params.get("spacing", 10)
+    lit = (_pixel_index(LED_count) - int(t * speed)) % spacing < width
+    out[:] = 0
+    out[lit] = params.get("color", DEFAULT_COLOR)
+    return out
+
+
+def twinkle(t, LED_count, params, out):
+    """Random pixels fade in and out
+    speed - twinkles per pixel per second - Normal:0.5
+    density - fraction of pixels that twinkle on each cycle 0.0 - 1.0 - Normal:0.3"""
+    speed = params.get("speed", 0.5)
+    density = params.get("density", 0.3)
+    index = _pixel_index(LED_count)
+    # Every pixel runs its own cycle offset by a fixed random phase
+    local_time = t * speed + _pixel_noise(LED_count, 1)
+    cycle = np.floor(local_time)
+    lit = _hash_noise(index, cycle) < density
+    intensity = np.sin(np.pi * (local_time - cycle)) * lit
+    np.multiply(intensity[:, None], params.get("color", DEFAULT_COLOR), out=out, casting="unsafe")
+    return out
+
+
+def gradient(t, LED_count, params, out):
+    """color to color2 and back along the strip, scrolling over time
+    speed - strip lengths per second - Normal:0.05"""
+    speed = params.get("speed", 0.05)
+    color = np.asarray(params.get("color", DEFAULT_COLOR), dtype=np.float64)
+    color2 = np.asarray(params.get("color2", DEFAULT_COLOR2), dtype=np.float64)
+    position = (_pixel_index(LED_count) / LED_count + t * speed) % 1.0
+    position = 1 - np.abs(2 * position - 1)  # 0 - 1 - 0 so the strip wraps without a seam
+    np.add(color, position[:, None] * (color2 - color), out=out, casting="unsafe")
+    return out
+
+
+def breathe(t, LED_count, params, out):
+    """The whole strip fades in and out
+    speed - breaths per second - Normal:0.25"""
+    speed = params.get("speed", 0.25)
+    intensity = (1 - np.cos(2 * np.pi * t * speed)) / 2
+    color = params.get("color", DEFAULT_COLOR)
+    out[:] = (int(color[0] * intensity), int(color[1] * intensity), int(color[2] * intensity))
+    return out
+
+
+EFFECTS = {
+    "rainbow": rainbow,
+    "chase": chase,
+    "twinkle": twinkle,
+    "gradient": gradient,
+    "breathe": breathe,
+}
@@ -0,0 +1,82 @@
+"""
+Event trace
+ A fixed size ring buffer of timestamped events kept in memory in place of
+ print() in the setters and render paths. Recording an event is a couple of
+ list stores with no I/O and no allocation beyond the event's own arguments,
+ so the HAP event loop never blocks on a slow SD card. The buffer is written
+ out only when asked for. There is no lock, two threads recording at the same
+ instant can rarely overwrite one event.
+
+ Events
+ setter - strip, setter name, value - a HomeKit characteristic write
+ mode - strip, new mode - the power gesture changed the mode
+ effect - strip, effect name - the power gesture selected the next effect in effect mode
+ frame - strip, frames pushed so far - the render thread pushed a frame
+ fade_direction - strip, direction - the color fade turned around
+ layer - strip, layer name, color or "clear" - an overlay layer was shown or cleared, ie a flash
+ rgbw - strip, red, green, blue, white - the color the RGBW accessory (one_accessory) worked out
+
+ Dump
+     kill -USR1 <pid> - writes the trace to /tmp/jlights-trace-<pid>.txt
+     http://<pi>:<metrics port>/trace - See metrics.py
+"""
+
+import os
+import signal
+import time
+
+TRACE_SIZE = 4096  # events kept, the oldest are overwritten
+
+
+class TraceBuffer:
+
+    def __init__(self, size=TRACE_SIZE):
+        self.size = size
+        self._times = [0] * size
+        self._events = [None] * size
+        self._index = 0
+        self.recorded = 0  # events recorded since start, more than size means some were overwritten
+
+    def record(self, event, *args):
+        """Records an event - event is a short name, args are kept as they are"""
+        index = self._index
+        self._times[index] = time.monotonic_ns()
+        self._events[index] = (event, args)
+        self._index = (index + 1) % self.size
+        self.recorded += 1
+
+    def events(self):
+        """(time in ns, event, args) oldest first"""
+        index = self._index
+        times = self._times[index:] + self._times[:index]
+        events = self._events[index:] + self._events[:index]
+        return [(t, event[0], event[1]) for t, event in zip(times, events) if event is not None]
+
+    def format(self):
+        """The trace as text, one event per line with the time in seconds before the newest event"""
+        events = self.events()
+        if not events:
+            return ""
+        newest = events[-1][0]
+        return "".join("{:>12.6f} {} {}\n".format((t - newest) / 1e9, event, " ".join(str(arg) for arg in args))
+                       for t, event, args in events)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            f.write("# {} events recorded, last {} kept\n".format(self.recorded, min(self.recorded, self.size)))
+            f.write(self.format())
+        return path
+
+
+TRACE = TraceBuffer()
+
+
+def install_dump_signal(signum=signal.SIGUSR1, path=None):
+    """Dumps TRACE to path when the process gets signum - Normal:/tmp/jlights-trace-<pid>.txt"""
+    if path is None:
+        path = "/tmp/jlights-trace-{}.txt".format(os.getpid())
+
+    def dump(signum, frame):
+        TRACE.dump(path)
+    signal.signal(signum, dump)
+    return path
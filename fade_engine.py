@@ -0,0 +1,82 @@
+"""
+Time based color fade
+ The fade color is worked out as a closed form function of the time since the
+ fade started instead of adding a small hue/saturation step every interval.
+ Nothing accumulates so the fade can't drift past its end points, the direction
+ flips exactly on time and a late frame simply renders the color for the
+ current time.
+
+ The fade runs start color -> end color -> start color ... with each leg
+ taking transition_length seconds
+     position  0.0 ------ 1.0 ------ 0.0
+     direction    0x00 FWD    0x01 REV
+
+ Fade curve
+ The colors in between are interpolated in Oklab (see color_conversion) so red
+ to blue passes through an even purple instead of a dark muddy one, and warm to
+ cool whites stay white. The whole leg is precomputed into curve_steps colors
+ the first time a frame needs it after the colors change, a frame is then only
+ an index into the curve - no color conversion per frame.
+ curve - curve_steps * 3 bytes of 8bit RGB
+ fine_curve - (curve_steps, 3) float32 RGB for dithered frame buffers
+"""
+
+import numpy as np
+
+from color_conversion import oklab_gradient
+
+FADE_CURVE_STEPS = 1024  # a 10 minute leg moves about a quarter of an 8bit step per curve entry
+
+
+class ColorFade:
+
+    def __init__(self, transition_length, curve_steps=FADE_CURVE_STEPS):
+        """transition_length - seconds to fade from start to end color
+        curve_steps - colors precomputed per leg - Normal:1024"""
+        self.transition_length = transition_length
+        self.curve_steps = curve_steps
+        self.start_time = 0.0
+        self.direction = 0x00  # 0=FWD  1=REV ie start_color to end_color
+        self.curve = None
+        self.fine_curve = None
+        self._colors = ((0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+
+    def set_colors(self, start_rgb, end_rgb):
+        """Sets the 0.0 - 255.0 RGB colors to fade between, the curve is rebuilt when they changed"""
+        colors = (tuple(start_rgb), tuple(end_rgb))
+        if colors != self._colors or self.curve is None:
+            self._colors = colors
+            self.curve = self.fine_curve = None
+
+    def restart(self, now):
+        """Starts the fade again from the start color"""
+        self.start_time = now
+        self.direction = 0x00
+
+    def position(self, now):
+        """Returns how far between the start (0.0) and end (1.0) color the fade is at time now
+        Also updates the direction of the fade"""
+        phase = ((now - self.start_time) / self.transition_length) % 2
+        if phase < 1:
+            self.direction = 0x00
+            return phase
+        self.direction = 0x01
+        return 2 - phase
+
+    def _build_curve(self):
+        self.fine_curve = oklab_gradient(self._colors[0], self._colors[1], self.curve_steps).astype(np.float32)
+        self.curve = np.rint(self.fine_curve).astype(np.uint8).tobytes()
+
+    def rgb_at(self, now):
+        """8bit red, green, blue of the fade at time now"""
+        if self.curve is None:
+            self._build_curve()
+        index = int(self.position(now) * (self.curve_steps - 1) + 0.5) * 3
+        curve = self.curve
+        return curve[index], curve[index + 1], curve[index + 2]
+
+    def rgb_fine_at(self, now):
+        """Same as rgb_at as floats 0.0 - 255.0 for dithering"""
+        if self.curve is None:
+            self._build_curve()
+        return tuple(self.fine_curve[int(self.position(now) * (self.curve_steps - 1) + 0.5)].tolist())
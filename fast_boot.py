@@ -0,0 +1,189 @@
+"""
+Fast boot
+ At boot the strip stays dark until HomeKit replays Brightness - State, and
+ importing pyhap and numpy takes seconds on a Pi Zero. The accessory keeps a
+ small binary snapshot of its last state, the entry script lights the strip
+ from it before importing anything heavy, then the accessory restores the
+ rest of its state from the same snapshot once it is built.
+
+ This module only imports the standard library, output_backends and calibration
+ so it can be imported first.
+
+ Snapshot - 44 bytes little endian
+     magic b"JLSS", version, accessory_state, mode, color fade direction
+     primary hue, saturation, brightness - float
+     secondary hue, saturation, brightness - float
+     seconds into the color fade - float
+     r, g, b of the color last shown
+     primary, secondary color temperature in mired - 0 when the color is not one, padding
+
+ Use in an entry script
+     output = fast_boot.light_from_snapshot("kitchen.snapshot", 144, "GRB", 18)
+     ...import pyhap and build the accessory...
+     NeoPixelLightStrip_Fader(..., output=output, snapshot_file="kitchen.snapshot")
+
+ time_to_first_frame() is the seconds from process start to the first frame
+ pushed to a strip, jlights_time_to_first_frame_seconds in the metrics.
+"""
+
+import logging
+import os
+import struct
+import time
+from collections import namedtuple
+
+from calibration import Calibration
+from output_backends import make_output
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"JLSS"
+SNAPSHOT_VERSION = 1
+SNAPSHOT = struct.Struct("<4sBBBBfffffffBBBHHx")
+
+Snapshot = namedtuple("Snapshot", ["accessory_state", "mode", "color_fade_direction",
+                                   "primary_hsv", "secondary_hsv", "color_fade_elapsed", "rgb",
+                                   "primary_mired", "secondary_mired"], defaults=(0, 0))
+
+
+def _process_age():
+    """Seconds since this process started, from /proc on Linux, 0.0 elsewhere"""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"), 0.0)  # starttime is field 22
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+_PROCESS_START = time.monotonic() - _process_age()
+_first_frame_time = None
+
+
+def mark_first_frame():
+    """Records the first frame pushed to any strip - Later calls do nothing"""
+    global _first_frame_time
+    if _first_frame_time is None:
+        _first_frame_time = time.monotonic()
+
+
+def first_frame_shown():
+    return _first_frame_time is not None
+
+
+def time_to_first_frame():
+    """Seconds from process start to the first frame, nan until there is one"""
+    if _first_frame_time is None:
+        return float("nan")
+    return _first_frame_time - _PROCESS_START
+
+
+def pack_snapshot(snapshot):
+    return SNAPSHOT.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, snapshot.accessory_state, snapshot.mode,
+                         snapshot.color_fade_direction, *snapshot.primary_hsv, *snapshot.secondary_hsv,
+                         snapshot.color_fade_elapsed, *snapshot.rgb, snapshot.primary_mired,
+                         snapshot.secondary_mired)
+
+
+def load_snapshot(path):
+    """The Snapshot saved at path, None when there is none or it can't be read"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(SNAPSHOT.size + 1)
+    except OSError:
+        return None
+    if len(data) != SNAPSHOT.size:
+        return None
+    fields = SNAPSHOT.unpack(data)
+    if fields[0] != SNAPSHOT_MAGIC or fields[1] != SNAPSHOT_VERSION:
+        return None
+    return Snapshot(fields[2], fields[3], fields[4], fields[5:8], fields[8:11], fields[11], fields[12:15],
+                    fields[15], fields[16])
+
+
+def save_snapshot(path, snapshot):
+    """Writes the snapshot so a power cut leaves either the old or the new one"""
+    _replace_file(path, pack_snapshot(snapshot))
+
+
+def _replace_file(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class SnapshotWriter:
+    """Saves snapshots off the event loop
+    request() can be called on every change, the newest snapshot is written
+    once per delay in the loop's executor and only when it changed"""
+
+    def __init__(self, path, loop, snapshot, delay=1.0):
+        """
+        path - snapshot file
+        loop - event loop the writes are scheduled on - Normal:driver.loop
+        snapshot - called with no arguments for the current Snapshot
+        delay - seconds to wait for more changes before writing - Normal:1.0
+        """
+        self.path = path
+        self.loop = loop
+        self.snapshot = snapshot
+        self.delay = delay
+        self.writes = 0
+        self._handle = None
+        self._last_data = None
+
+    def request(self):
+        """Must be called on the event loop thread"""
+        if self._handle is None:
+            self._handle = self.loop.call_later(self.delay, self._write)
+
+    def flush(self):
+        """Writes the current snapshot straight away on this thread, ie on shutdown"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        data = pack_snapshot(self.snapshot())
+        if data != self._last_data:
+            self._last_data = data
+            self._save(data)
+
+    def _write(self):
+        self._handle = None
+        data = pack_snapshot(self.snapshot())
+        if data == self._last_data:
+            return  # Nothing changed, save the SD card a write
+        self._last_data = data
+        self.loop.run_in_executor(None, self._save, data)
+
+    def _save(self, data):
+        try:
+            _replace_file(self.path, data)
+            self.writes += 1
+        except OSError:
+            logger.exception("Could not save the snapshot to %s", self.path)
+
+
+def light_from_snapshot(path, LED_count, pixel_order="GRB", LED_pin=18, LED_brightness=255, backend=None,
+                        calibration=None):
+    """Creates the strip's output backend and shows the color in the snapshot on it straight away
+    Returns the output to hand to the accessory, the strip is left as it is when there is no snapshot
+    calibration - the strip's calibration so the boot color matches the accessory - Normal:None"""
+    output = make_output(LED_count, pixel_order, LED_pin, backend)
+    snapshot = load_snapshot(path)
+    if snapshot is None:
+        return output
+
+    color = snapshot.rgb + (0,) if snapshot.accessory_state == 1 else (0, 0, 0, 0)
+    calibration = Calibration.from_config(calibration)
+    if calibration is None:
+        scale = LED_brightness / 255
+        pixel = bytes(int(color["RGBW".index(channel)] * scale) for channel in pixel_order)
+    else:
+        tables = calibration.tables(LED_count, len(pixel_order), LED_brightness / 255)
+        pixel = bytes(tables["RGBW".index(channel)][color["RGBW".index(channel)]] for channel in pixel_order)
+    output.write(bytearray(pixel * LED_count))  # No numpy, a bytes repeat is fast enough for one frame
+    mark_first_frame()
+    return output
@@ -0,0 +1,275 @@
+"""
+Frame buffer for NeoPixel strips
+ Holds a whole strip worth of pixels in one NumPy uint8 array so a frame can be
+ filled, re-ordered to the strip's wire color order and handed to the output
+ backend (see output_backends) in a single call. This replaces building a Color and calling
+ setPixelColor for every LED from python, so a full strip update costs about
+ the same at 1000 LEDs as it does at 10.
+
+ Pixel orders use the same strings as the Adafruit neopixel library
+ ie neopixel.GRB == "GRB" and neopixel.GRBW == "GRBW"
+
+ Pixels are always written in RGB(W) order, the swizzle to the wire order
+ happens once per frame when the buffer is shown.
+
+ Dirty frames
+ The last pushed wire buffer is kept and show() skips the transfer when the
+ new frame is byte identical, each skip saves a full DMA transfer of the strip.
+ frames_shown - frames pushed to the strip
+ frames_skipped - frames skipped because nothing changed
+ With track_dirty_range=True, dirty_range is the (start, stop) pixel range that
+ changed in the last pushed frame for partial strip effects, None if unknown.
+
+ Calibration
+ Brightness and the strip's calibration (gamma, white balance, current limit -
+ see calibration.py) are compiled into one 256 entry table per channel when
+ they are set. Rendering looks every byte of the frame up in it in one
+ vectorized take, there is no per pixel python work.
+
+ Temporal dithering
+ With dither=True fill() takes float colors and keeps them in the float32
+ fine buffer. Brightness and calibration become DITHER_CURVE_SIZE entry float
+ curves instead of 8bit tables, and every render adds the rounding error of the
+ last frame back in before rounding to 8bit again. At a high frame rate the
+ eye averages the frames so a color between two 8bit steps, ie the bottom of a
+ slow fade or 1% HomeKit brightness, shows as that color instead of a visible
+ step. Writing to pixels switches rendering back to the 8bit pixels, they are
+ dithered through the same curves.
+
+ Overlay layers
+ add_layer() returns a frame_layers.Layer drawn over the pixels on every render,
+ before brightness and calibration, ie a notification flash over a running fade
+ without touching the fade. The blend buffers are allocated with the first
+ layer, a strip without layers renders exactly as before - See frame_layers.py
+"""
+
+import time
+
+import numpy as np
+
+from calibration import Calibration
+from frame_layers import Layer
+from profiling import TIMINGS
+
+DITHER_CURVE_SIZE = 4096  # Curve entries per channel, 16x finer than the 8bit input
+_LINEAR = Calibration(gamma=1.0)
+
+
+class FrameBuffer:
+
+    def __init__(self, LED_count, pixel_order="GRB", brightness=1.0, track_dirty_range=False, calibration=None,
+                 dither=False):
+        """
+        LED_count - the number of LEDs in the array
+        pixel_order - wire color order of the strip - Normal:"GRB"
+        brightness - overall brightness scale 0.0 - 1.0 - Normal:1.0
+        track_dirty_range - work out which pixels changed on every show - Normal:False
+        calibration - calibration.Calibration of this strip - Normal:None linear
+        dither - keep a float frame and temporally dither it to 8bit - Normal:False
+        """
+        self.LED_count = LED_count
+        self.pixel_order = pixel_order
+        self.channels = len(pixel_order)
+
+        # Source index in our RGB(W) layout for each wire byte ie GRB -> 1, 0, 2
+        self._swizzle = np.array(["RGBW".index(c) for c in pixel_order], dtype=np.intp)
+
+        self._pixels = np.zeros((LED_count, self.channels), dtype=np.uint8)  # RGB(W) order
+        self._scaled = np.zeros_like(self._pixels)
+
+        # The wire buffer is a view on a bytearray so the driver can take it without a copy
+        self.wire_bytes = bytearray(LED_count * self.channels)
+        self._wire = np.frombuffer(self.wire_bytes, dtype=np.uint8).reshape(LED_count, self.channels)
+
+        # Last frame sent to the strip, None until the first show
+        self._last_wire = None
+        self._changed = np.zeros((LED_count, self.channels), dtype=np.bool_)
+        self.track_dirty_range = track_dirty_range
+        self.dirty_range = None
+        self.frames_shown = 0
+        self.frames_skipped = 0
+
+        # Per channel tables are one flat table indexed by value + 256 * channel
+        self._lut = None
+        self._lut_offsets = np.arange(self.channels, dtype=np.uint16) * 256
+        self._lut_index = np.zeros((LED_count, self.channels), dtype=np.uint16)
+        self.dither = dither
+        if dither:
+            self.fine = np.zeros((LED_count, self.channels), dtype=np.float32)  # RGB(W) 0.0 - 255.0
+            self._fine_source = False  # True while fill() owns the frame, False once pixels is written
+            self._error = np.zeros_like(self.fine)  # Rounding error carried to the next frame
+            self._target = np.zeros_like(self.fine)
+            self._work = np.zeros_like(self.fine)
+            self._curve_index = np.zeros((LED_count, self.channels), dtype=np.uint16)
+            self._curve_offsets = np.arange(self.channels, dtype=np.uint16) * DITHER_CURVE_SIZE
+            self._curve = None
+        self._brightness = brightness
+        self._calibration = calibration
+        self._build_lut()
+
+        # Overlay layers in draw order, the blend buffers are allocated by the first add_layer
+        self.layers = []
+        self._composite = None
+
+    @property
+    def pixels(self):
+        """(LED_count, channels) uint8 RGB(W) pixels to draw into"""
+        if self.dither:
+            self._fine_source = False
+        return self._pixels
+
+    @property
+    def brightness(self):
+        return self._brightness
+
+    @brightness.setter
+    def brightness(self, value):
+        self._brightness = value
+        self._build_lut()
+
+    @property
+    def calibration(self):
+        return self._calibration
+
+    @calibration.setter
+    def calibration(self, value):
+        self._calibration = value
+        self._build_lut()
+
+    def _build_lut(self):
+        if self.dither:
+            calibration = self._calibration or _LINEAR
+            curves = calibration.curves(self.LED_count, self.channels, min(self._brightness, 1.0),
+                                        DITHER_CURVE_SIZE)
+            self._curve = np.array(curves, dtype=np.float32).reshape(-1)
+            return
+        if self._calibration is None:
+            if self._brightness >= 1.0:
+                self._lut = None
+            else:
+                # Scaling 0 - 255 through a table is a single vectorized lookup per frame
+                self._lut = (np.arange(256) * self._brightness).astype(np.uint8)
+            return
+        tables = self._calibration.tables(self.LED_count, self.channels, min(self._brightness, 1.0))
+        if all(table == tables[0] for table in tables):
+            self._lut = np.frombuffer(tables[0], dtype=np.uint8)  # Same for every channel, no offsets needed
+        else:
+            self._lut = np.frombuffer(b"".join(tables), dtype=np.uint8)
+
+    def add_layer(self, name=""):
+        """Adds an overlay layer on top of the others and returns it, the layer starts hidden"""
+        layer = Layer(self.LED_count, self.channels, name)
+        if self._composite is None:
+            self._composite = np.zeros((self.LED_count, self.channels), dtype=np.float32)
+            self._blend = np.zeros_like(self._composite)
+            self._layer_alpha = np.zeros((self.LED_count, 1), dtype=np.float32)
+            self._composite_bytes = np.zeros((self.LED_count, self.channels), dtype=np.uint8)
+        self.layers.append(layer)
+        return layer
+
+    def remove_layer(self, layer):
+        """Takes the layer off the frame, its pixels stop showing from the next render"""
+        self.layers.remove(layer)
+
+    def fill(self, red, green, blue, white=0):
+        """Sets every pixel to the same color - Values are 0 - 255, floats keep their fraction when dithering"""
+        if self.dither:
+            self.fine[:] = (red, green, blue, white)[:self.channels]
+            self._fine_source = True
+            return
+        self._pixels[:] = (red, green, blue, white)[:self.channels]
+
+    def render(self, pixels=None):
+        """Blends the overlay layers, applies brightness and color order to the pixels and returns the wire buffer
+        pixels - render these (LED_count, channels) RGB(W) pixels instead of our own, ie a shared
+                 memory frame from shared_framebuffer - Normal:None"""
+        if self.dither:
+            source = pixels if pixels is not None else self.fine if self._fine_source else self._pixels
+            self._dither(self._composite_layers(source))
+            np.take(self._scaled, self._swizzle, axis=1, out=self._wire)
+            return self.wire_bytes
+        source = self._composite_layers(self._pixels if pixels is None else pixels)
+        if self._lut is not None:
+            if len(self._lut) > 256:
+                np.add(source, self._lut_offsets, out=self._lut_index)
+                np.take(self._lut, self._lut_index, out=self._scaled)
+            else:
+                np.take(self._lut, source, out=self._scaled)
+            source = self._scaled
+        np.take(source, self._swizzle, axis=1, out=self._wire)
+        return self.wire_bytes
+
+    def _composite_layers(self, source):
+        """Blends the shown overlay layers over source and returns the result
+        Returns source itself when no layer is shown"""
+        if not any(layer.shown for layer in self.layers):
+            return source
+        composite = self._composite
+        np.copyto(composite, source)
+        for layer in self.layers:
+            if not layer.shown:
+                continue
+            np.multiply(layer.alpha, layer.opacity, out=self._layer_alpha[:, 0])
+            np.subtract(layer.pixels, composite, out=self._blend)
+            np.multiply(self._blend, self._layer_alpha, out=self._blend)
+            np.add(composite, self._blend, out=composite)
+        if self.dither:
+            return composite  # The dither curves take floats
+        np.rint(composite, out=self._blend)
+        np.copyto(self._composite_bytes, self._blend, casting="unsafe")
+        return self._composite_bytes
+
+    def _dither(self, source):
+        """Renders source through the float curves into _scaled, carrying the rounding error"""
+        np.multiply(source, (DITHER_CURVE_SIZE - 1) / 255, out=self._work)
+        np.add(self._work, 0.5, out=self._work)
+        np.copyto(self._curve_index, self._work, casting="unsafe")  # Rounds down to the curve entry
+        np.add(self._curve_index, self._curve_offsets, out=self._curve_index)
+        np.take(self._curve, self._curve_index, out=self._target)
+        np.add(self._target, self._error, out=self._target)
+        np.rint(self._target, out=self._work)
+        np.clip(self._work, 0, 255, out=self._work)
+        np.subtract(self._target, self._work, out=self._error)
+        np.copyto(self._scaled, self._work, casting="unsafe")
+
+    def show(self, output, force=False):
+        """Pushes the frame to an output backend in one bulk write
+        Returns False when the frame was skipped because it had not changed"""
+        if TIMINGS.enabled:  # Only while a profile runs - See profiling
+            start = time.perf_counter()
+            self.render()
+            shown = self.push(output, force)
+            TIMINGS.add("show" if shown else "show_skipped", start, time.perf_counter() - start)
+            return shown
+        self.render()
+        return self.push(output, force)
+
+    def push(self, output, force=False):
+        """Pushes the already rendered wire buffer, show() without the render
+        Returns False when the frame was skipped because it had not changed"""
+        if not self._is_dirty() and not force:
+            self.frames_skipped += 1
+            return False
+
+        output.write(self.wire_bytes)
+        self.frames_shown += 1
+        return True
+
+    def _is_dirty(self):
+        """Compares the rendered wire buffer with the last pushed one and remembers it"""
+        if self._last_wire is None:
+            self._last_wire = self._wire.copy()
+            self.dirty_range = (0, self.LED_count)
+            return True
+
+        np.not_equal(self._wire, self._last_wire, out=self._changed)
+        if self.track_dirty_range:
+            changed_pixels = np.flatnonzero(self._changed.any(axis=1))
+            if len(changed_pixels) == 0:
+                return False
+            self.dirty_range = (int(changed_pixels[0]), int(changed_pixels[-1]) + 1)
+        elif not self._changed.any():
+            return False
+
+        self._last_wire[:] = self._wire
+        return True
@@ -0,0 +1,88 @@
+"""
+Shared frame clock
+ Calls every registered render callback once per frame at a fixed frame rate
+ on the event loop, so all the strips in one process render aligned frames
+ from the same timestamp instead of each running its own timer.
+
+ Frames are timed against the wall clock, when a frame is late the missed
+ frames are dropped and counted in late_frames, the next frame renders for
+ the current time. achieved_fps is the frame rate over the last second.
+
+ Usage
+     clock = FrameClock(60)
+     clock.add(strip.render_tick)  # called as render_tick(now)
+     await clock.run(driver.aio_stop_event)
+"""
+
+import logging
+import time
+
+from pyhap import util
+
+from metrics import METRICS
+from profiling import TIMINGS
+
+logger = logging.getLogger(__name__)
+
+
+class FrameClock:
+
+    def __init__(self, fps):
+        """fps - frames per second every callback is called at"""
+        self.fps = fps
+        self.frames = 0
+        self.late_frames = 0
+        self.achieved_fps = 0.0
+        self._window_start = None
+        self._window_frames = 0
+        self._callbacks = []
+
+    def register_metrics(self, name):
+        """Adds this clock's frame rate and late frames to the metrics labelled clock=name"""
+        METRICS.gauge("jlights_target_fps", "Frame rate the clock runs at", lambda: self.fps, clock=name)
+        METRICS.gauge("jlights_achieved_fps", "Frame rate the clock ran at over the last second",
+                      lambda: self.achieved_fps, clock=name)
+        METRICS.counter("jlights_late_frames_total", "Frames the clock missed", lambda: self.late_frames, clock=name)
+
+    def add(self, callback):
+        """callback(now) is called every frame with now from time.monotonic()"""
+        self._callbacks.append(callback)
+
+    def tick(self, now):
+        """Renders one frame on every callback"""
+        self.frames += 1
+        if self._window_start is None:
+            self._window_start = now
+        elif now - self._window_start >= 1.0:
+            self.achieved_fps = self._window_frames / (now - self._window_start)
+            self._window_start = now
+            self._window_frames = 0
+        self._window_frames += 1
+        timed = TIMINGS.enabled  # Only while a profile runs - See profiling
+        if timed:
+            start = time.perf_counter()
+        for callback in self._callbacks:
+            try:
+                callback(now)
+            except Exception:
+                # One broken strip should not stop the others
+                logger.exception("Frame clock callback %s failed", callback)
+        if timed:
+            TIMINGS.add("tick", start, time.perf_counter() - start)
+
+    async def run(self, stop_event):
+        """Ticks until stop_event is set"""
+        next_frame_time = time.monotonic()
+        while True:
+            self.tick(time.monotonic())
+
+            frame_interval = 1 / self.fps
+            next_frame_time += frame_interval
+            delay = next_frame_time - time.monotonic()
+            if delay < 0:
+                missed_frames = int(-delay / frame_interval) + 1
+                self.late_frames += missed_frames
+                next_frame_time += missed_frames * frame_interval
+                delay = next_frame_time - time.monotonic()
+            if await util.event_wait(stop_event, delay):
+                break
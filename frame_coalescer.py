@@ -0,0 +1,77 @@
+"""
+Coalesces HomeKit characteristic writes into a single rendered frame
+ HomeKit sends one color change as several characteristic writes
+ Changing Brightness - Brightness - State
+ Changing Color      - Saturation - Hue
+ Setter callbacks only record the new state and call request(), the render
+ runs once per window on the event loop so a color change from the Home app
+ costs one show() instead of two or three.
+
+ window - seconds to wait for more writes before rendering
+          0 renders on the next event loop tick
+
+ Counters
+ requests - number of times a frame was requested
+ renders - number of frames actually rendered
+ saved - frames coalescing saved (requests - renders)
+"""
+
+import asyncio
+
+
+class FrameCoalescer:
+
+    def __init__(self, loop, render, window=0.01):
+        """
+        loop - the event loop the render runs on - Normal:driver.loop
+        render - called with no arguments to push the current state to the strip
+        window - seconds to collect writes before rendering - Normal:0.01
+        """
+        self.loop = loop
+        self.render = render
+        self.window = window
+        self.requests = 0
+        self.renders = 0
+        self._handle = None  # Only touched from the event loop thread
+
+    @property
+    def saved(self):
+        """Number of frames coalescing has saved"""
+        return self.requests - self.renders
+
+    @property
+    def pending(self):
+        return self._handle is not None
+
+    def request(self):
+        """Asks for a frame to be rendered with the state at the end of the window"""
+        self.requests += 1
+        if self._in_loop_thread():
+            self._schedule()
+        else:
+            self.loop.call_soon_threadsafe(self._schedule)
+
+    def flush(self):
+        """Renders a pending frame straight away - Must be called on the event loop thread"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._render()
+
+    def _in_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _schedule(self):
+        if self._handle is not None:
+            return  # Already rendering at the end of this window
+        if self.window > 0:
+            self._handle = self.loop.call_later(self.window, self._render)
+        else:
+            self._handle = self.loop.call_soon(self._render)
+
+    def _render(self):
+        self._handle = None
+        self.renders += 1
+        self.render()
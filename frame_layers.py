@@ -0,0 +1,61 @@
+"""
+Overlay layers for the frame buffer
+ A strip's frame used to be one solid color or effect written straight into
+ the frame buffer, so anything shown on top of it, ie a notification flash,
+ had to overwrite the running state and put it back after. An overlay layer is
+ drawn over the frame instead and blended in when the frame is rendered, the
+ fade or effect underneath carries on and shows again as soon as the layer is
+ cleared.
+
+ A frame is rendered in stages, each one a whole array NumPy operation on
+ buffers allocated when the frame buffer and its layers are created
+     base - the strip's own pixels (color, fade, effect or network frame),
+            HomeKit brightness is already in them
+     overlays - every visible layer in the order they were added,
+                out = base + (layer - base) * alpha * opacity
+     brightness and calibration - one table lookup, or the dither curves
+     color order - swizzle to the strip's wire order ie GRB or GRBW
+     output - one bulk write of the wire buffer
+ With no visible layer the overlay stage is skipped and a frame costs the same
+ as before layers existed.
+
+ Usage
+     flash = frame.add_layer("flash")
+     flash.fill(255, 0, 0)  # Covers the strip in red
+     flash.fill(255, 255, 255, alpha=0.3)  # A faint white wash over the fade
+     flash.alpha[:10] = 0  # Per pixel alpha, the first 10 LEDs show the base
+     flash.clear()
+"""
+
+import numpy as np
+
+
+class Layer:
+
+    def __init__(self, LED_count, channels, name=""):
+        """
+        LED_count - the number of LEDs in the array
+        channels - 3 for RGB strips, 4 for RGBW
+        name - shown in the event trace, see event_trace - Normal:""
+        """
+        self.name = name
+        self.pixels = np.zeros((LED_count, channels), dtype=np.float32)  # RGB(W) 0.0 - 255.0
+        self.alpha = np.zeros(LED_count, dtype=np.float32)  # Per pixel 0.0 (base shows) - 1.0 (layer shows)
+        self.opacity = 1.0  # Scales the whole layer's alpha, ie to fade the layer in and out
+        self.visible = False
+
+    def fill(self, red, green, blue, white=0, alpha=1.0):
+        """Sets every pixel of the layer to the same color and alpha and shows the layer"""
+        self.pixels[:] = (red, green, blue, white)[:self.pixels.shape[1]]
+        self.alpha[:] = alpha
+        self.visible = True
+
+    def clear(self):
+        """Hides the layer, the base frame shows again from the next render"""
+        self.alpha[:] = 0
+        self.visible = False
+
+    @property
+    def shown(self):
+        """True when the layer changes the frame"""
+        return self.visible and self.opacity > 0
@@ -22,11 +22,13 @@ An Accessory for Adafruit NeoPixels attached to GPIO Pin18
  Changing State      - State
 """
 
-from neopixel import *
-
 from pyhap.accessory import Accessory
 from pyhap.const import CATEGORY_LIGHTBULB
 
+from color_conversion import hsv_to_rgb
+from frame_buffer import FrameBuffer
+from output_backends import make_output
+
 
 class NeoPixelLightStrip(Accessory):
 
@@ -70,12 +72,12 @@ class NeoPixelLightStrip(Accessory):
         self.saturation = 100  # Saturation Values 0 - 100 Homekit API
         self.brightness = 100  # Brightness value 0 - 100 Homekit API
 
-        self.is_GRB = is_GRBW  # Most neopixels are Green Red Blue
+        self.is_GRB = is_GRB  # Most neopixels are Green Red Blue
         self.LED_count = LED_count
 
-        self.neo_strip = Adafruit_NeoPixel(LED_count, LED_pin, LED_freq_hz,
-                                           LED_DMA, LED_invert, LED_brightness)
-        self.neo_strip.begin()
+        pixel_order = "GRB" if is_GRB else "RGB"
+        self.neo_strip = make_output(LED_count, pixel_order, LED_pin)
+        self.frame = FrameBuffer(LED_count, pixel_order, LED_brightness / 255)
 
     def set_state(self, value):
         self.accessory_state = value
@@ -89,7 +91,7 @@ class NeoPixelLightStrip(Accessory):
         # otherwise update the hue value only
         if self.accessory_state == 1:
             self.hue = value
-            rgb_tuple = self.hsv_to_rgb(
+            rgb_tuple = hsv_to_rgb(
                 self.hue, self.saturation, self.brightness)
             if len(rgb_tuple) == 3:
                 self.update_neopixel_with_color(
@@ -106,53 +108,5 @@ class NeoPixelLightStrip(Accessory):
         self.set_hue(self.hue)
 
     def update_neopixel_with_color(self, red, green, blue):
-        for i in range(self.LED_count):
-            if(self.is_GRB):
-                self.neo_strip.setPixelColor(i, Color(int(green),
-                                                      int(red),
-                                                      int(blue)))
-            else:
-                self.neo_strip.setPixelColor(i, Color(int(red),
-                                                      int(green),
-                                                      int(blue)))
-
-        self.neo_strip.show()
-
-    def hsv_to_rgb(self, h, s, v):
-        """
-        This function takes
-         h - 0 - 360 Deg
-         s - 0 - 100 %
-         v - 0 - 100 %
-        """
-
-        hPri = h / 60
-        s = s / 100
-        v = v / 100
-
-        if s <= 0.0:
-            return int(0), int(0), int(0)
-
-        C = v * s  # Chroma
-        X = C * (1 - abs(hPri % 2 - 1))
-
-        RGB_Pri = [0.0, 0.0, 0.0]
-
-        if 0 <= hPri <= 1:
-            RGB_Pri = [C, X, 0]
-        elif 1 <= hPri <= 2:
-            RGB_Pri = [X, C, 0]
-        elif 2 <= hPri <= 3:
-            RGB_Pri = [0, C, X]
-        elif 3 <= hPri <= 4:
-            RGB_Pri = [0, X, C]
-        elif 4 <= hPri <= 5:
-            RGB_Pri = [X, 0, C]
-        elif 5 <= hPri <= 6:
-            RGB_Pri = [C, 0, X]
-        else:
-            RGB_Pri = [0, 0, 0]
-
-        m = v - C
-
-        return int((RGB_Pri[0] + m) * 255), int((RGB_Pri[1] + m) * 255), int((RGB_Pri[2] + m) * 255)
\ No newline at end of file
+        self.frame.fill(red, green, blue)
+        self.frame.show(self.neo_strip)
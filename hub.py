@@ -0,0 +1,188 @@
+"""
+Multi strip hub
+ Hosts every NeoPixel strip of an install on one HomeKit Bridge in one process.
+ All strips share one AccessoryDriver, one render thread pushing the frames
+ and one frame clock so every strip renders aligned frames, instead of running
+ one process with its own driver, port and timers per strip.
+
+ The strips are described in a JSON config file - See hub_config.example.json
+ {
+   "bridge_name": "JLights",
+   "port": 51826,
+   "persist_file": "hub.state",
+   "fps": 60,
+   "metrics_port": 9100,
+   "strips": [
+     {"name": "Kitchen", "type": "fader", "LED_count": 144, "LED_pin": 18},
+     {"name": "Desk", "type": "rgbw", "LED_count": 60, "LED_pin": 21}
+   ]
+ }
+
+ Metrics - See metrics.py
+     metrics_port - serve Prometheus text on http://<host>:<port>/metrics - Normal:off
+     metrics_host - interface to serve on, "0.0.0.0" lets other machines scrape it,
+                    there is no authentication - Normal:"127.0.0.1"
+     metrics_log_interval - seconds between metrics log lines - Normal:off
+
+ Every strip
+     output - output backend ie "sim" or "ddp:192.168.1.50", see output_backends - Normal:JLIGHTS_OUTPUT
+     LED_pin - GPIO pin of a NeoPixel output, every strip needs its own ie 18, 13 and 21 - Normal:18
+     calibration - {"gamma": 2.2, "white_balance": [1.0, 0.85, 0.7], "max_milliamps": 4000},
+                   see calibration.py - Normal:off
+
+ Strip types
+ fader - NeoPixelLightStrip.NeoPixelLightStrip_Fader, RGB with color fade and effects
+     is_GRB - Normal:true
+     brightness - overall brightness 0 - 255 - Normal:255
+     color_fade - start up in color fade mode - Normal:false
+     effect - first effect of effect mode, the power gesture steps through the others - Normal:"rainbow"
+     effect_worker - draw the effect in its own process, see shared_framebuffer - Normal:false
+     realtime_port - UDP port for DDP or E1.31 frames from other software, see realtime_ingest - Normal:off
+     realtime_universe - first E1.31 universe of the strip - Normal:1
+     show_file - recorded show for show mode, see recorded_show - Normal:no show mode
+     dither - temporally dither single color and color fade at the hub fps, see frame_buffer - Normal:false
+     snapshot_file - last state of the strip, it is lit from it before the bridge is built,
+                     see fast_boot - Normal:off
+ rgbw - one_accessory.NeoPixelLightStrip, RGBW strip
+
+ Run
+     python3 hub.py [config file]
+"""
+
+import json
+import logging
+import signal
+import sys
+
+# Only modules that don't import pyhap or numpy here, the strips are lit by boot_strips before those load
+import event_trace
+import fast_boot
+import metrics
+import profiling
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_FILE = "hub_config.json"
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    if not config.get("strips"):
+        raise ValueError("{} has no strips - See hub_config.example.json".format(path))
+    return config
+
+
+def make_hub_bridge(driver, display_name, fps=60):
+    """Creates the Bridge that owns the render thread and frame clock shared by its strips
+    pyhap, the frame clock and the render thread are only imported here, after boot_strips"""
+    from pyhap.accessory import Bridge
+
+    from frame_clock import FrameClock
+    from render_thread import RenderThread
+
+    class HubBridge(Bridge):
+
+        def __init__(self, driver, display_name, fps=60):
+            super().__init__(driver, display_name)
+            self.render_thread = RenderThread(name="Hub render").start()
+            self.frame_clock = FrameClock(fps)
+            self.frame_clock.register_metrics(display_name)
+
+        async def run(self):
+            await super().run()
+            await self.frame_clock.run(self.driver.aio_stop_event)
+
+        async def stop(self):
+            await super().stop()
+            self.render_thread.stop()
+
+    return HubBridge(driver, display_name, fps)
+
+
+def boot_strips(config):
+    """Lights every strip that has a snapshot_file with its last state
+    Returns the outputs by strip name to hand to build_bridge"""
+    outputs = {}
+    for strip_config in config["strips"]:
+        if strip_config.get("snapshot_file") and strip_config.get("type", "fader") == "fader":
+            outputs[strip_config["name"]] = fast_boot.light_from_snapshot(
+                strip_config["snapshot_file"], strip_config["LED_count"],
+                "GRB" if strip_config.get("is_GRB", True) else "RGB", strip_config.get("LED_pin", 18),
+                strip_config.get("brightness", 255), strip_config.get("output"), strip_config.get("calibration"))
+    return outputs
+
+
+def create_strip(driver, bridge, strip_config, output=None):
+    """Creates the accessory for one entry of the strips list
+    output - the strip's output if boot_strips already created it - Normal:None"""
+    strip_type = strip_config.get("type", "fader")
+    name = strip_config["name"]
+    LED_count = strip_config["LED_count"]
+    LED_pin = strip_config.get("LED_pin", 18)
+
+    if strip_type == "fader":
+        from NeoPixelLightStrip import NeoPixelLightStrip_Fader
+        strip = NeoPixelLightStrip_Fader(strip_config.get("color_fade", False), LED_count,
+                                         strip_config.get("is_GRB", True), LED_pin, 800000, 10,
+                                         strip_config.get("brightness", 255), False, driver, name,
+                                         render_thread=bridge.render_thread, frame_clock=bridge.frame_clock,
+                                         effect_worker=strip_config.get("effect_worker", False),
+                                         output=output or strip_config.get("output"),
+                                         realtime_port=strip_config.get("realtime_port"),
+                                         realtime_universe=strip_config.get("realtime_universe", 1),
+                                         show_file=strip_config.get("show_file"),
+                                         snapshot_file=strip_config.get("snapshot_file"),
+                                         calibration=strip_config.get("calibration"),
+                                         dither_fps=bridge.frame_clock.fps if strip_config.get("dither") else None)
+        if "effect" in strip_config:
+            strip.set_effect(strip_config["effect"], **strip_config.get("effect_params", {}))
+        return strip
+
+    if strip_type == "rgbw":
+        from one_accessory import NeoPixelLightStrip
+        return NeoPixelLightStrip(LED_count, True, LED_pin, 800000, 10, 255, False, driver, name,
+                                  render_thread=bridge.render_thread, output=strip_config.get("output"),
+                                  calibration=strip_config.get("calibration"))
+
+    raise ValueError("Unknown strip type {} for {} - Use fader or rgbw".format(strip_type, name))
+
+
+def build_bridge(driver, config, outputs=None):
+    """Builds the Bridge with every strip in the config
+    outputs - from boot_strips - Normal:None"""
+    outputs = outputs or {}
+    bridge = make_hub_bridge(driver, config.get("bridge_name", "JLights"), config.get("fps", 60))
+    for strip_config in config["strips"]:
+        bridge.add_accessory(create_strip(driver, bridge, strip_config, outputs.get(strip_config["name"])))
+        logger.info("Added strip %s", strip_config["name"])
+    return bridge
+
+
+def main(config_file=DEFAULT_CONFIG_FILE):
+    config = load_config(config_file)
+    outputs = boot_strips(config)  # Before the slow driver import and HAP start up
+
+    from pyhap.accessory_driver import AccessoryDriver
+
+    metrics.start_from_env()
+    event_trace.install_dump_signal()
+    profiling.install_signal()
+    if config.get("metrics_port"):
+        metrics.start_http_server(config["metrics_port"], config.get("metrics_host", "127.0.0.1"))
+    if config.get("metrics_log_interval"):
+        metrics.start_log(config["metrics_log_interval"])
+
+    driver = AccessoryDriver(port=config.get("port", 51826), persist_file=config.get("persist_file", "hub.state"))
+    driver.add_accessory(accessory=build_bridge(driver, config, outputs))
+
+    # We want SIGTERM (kill) to be handled by the driver itself,
+    # so that it can gracefully stop the accessory, server and advertising.
+    signal.signal(signal.SIGTERM, driver.signal_handler)
+
+    driver.start()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(module)s] %(message)s")
+    main(*sys.argv[1:2])
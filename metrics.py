@@ -0,0 +1,254 @@
+"""
+Metrics
+ Latency histograms and frame counters for every strip in the process, read
+ out as Prometheus text over HTTP or as a periodic log line so we can prove a
+ strip meets its latency targets under load.
+
+ What is recorded
+ jlights_setter_seconds{strip,setter} - histogram of each HomeKit setter callback
+ jlights_show_seconds{strip} - histogram of pushing one frame to the strip
+ jlights_frames_published_total{strip} - frames handed to the render thread
+ jlights_frames_rendered_total{strip} - frames pushed to the strip
+ jlights_frames_dropped_total{strip} - frames replaced before they were pushed
+ jlights_frames_skipped_total{strip} - frames not pushed because nothing changed
+ jlights_coalesce_requests_total{strip} / jlights_coalesce_renders_total{strip} - HomeKit writes and the frames they cost
+ jlights_target_fps{clock} / jlights_achieved_fps{clock} - frame clock rate
+ jlights_late_frames_total{clock} - frames the clock missed
+ jlights_time_to_first_frame_seconds - process start to the first frame on a strip, see fast_boot
+
+ Histograms are fixed buckets, an observation is one bisect and three adds.
+ Counters that already exist on the frame buffer, render thread, coalescer
+ and clock are read when the metrics are collected, nothing is counted twice.
+
+ Start from the environment, ie in neo_main.py
+     JLIGHTS_METRICS_PORT=9100 - Prometheus text on http://127.0.0.1:9100/metrics
+                                 and the event trace on http://127.0.0.1:9100/trace
+     JLIGHTS_METRICS_HOST=0.0.0.0 - serve on every interface so another machine can scrape
+     JLIGHTS_METRICS_LOG=60 - log a summary line every 60 seconds
+
+ The endpoint has no authentication and the trace shows accessory names and
+ setter values, so it only listens on localhost unless a host is given.
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# seconds - 50us to 250ms covers a setter on a Pi Zero through a 2000 LED transfer
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last count is above the highest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile, inf when above every bucket"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class _Family:
+    """All the series of one metric name"""
+
+    def __init__(self, name, kind, help_text, label_names):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.label_names = label_names
+        self.series = {}  # label values -> Histogram or a function returning the value
+
+
+class HistogramFamily(_Family):
+
+    def __init__(self, name, help_text, label_names, buckets):
+        super().__init__(name, "histogram", help_text, label_names)
+        self.buckets = buckets
+
+    def labels(self, *values):
+        """The Histogram for these label values - Keep it, the lookup is not free"""
+        histogram = self.series.get(values)
+        if histogram is None:
+            histogram = self.series[values] = Histogram(self.buckets)
+        return histogram
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = HistogramFamily(name, help_text, tuple(label_names), buckets)
+        return family
+
+    def counter(self, name, help_text, read, **labels):
+        """Registers read() as the value of a counter, the same labels replace an earlier one"""
+        self._register(name, "counter", help_text, read, labels)
+
+    def gauge(self, name, help_text, read, **labels):
+        """Registers read() as the value of a gauge, the same labels replace an earlier one"""
+        self._register(name, "gauge", help_text, read, labels)
+
+    def _register(self, name, kind, help_text, read, labels):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = _Family(name, kind, help_text, tuple(sorted(labels)))
+            family.series[tuple(labels[label] for label in family.label_names)] = read
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            families = list(self._families.values())
+        for family in families:
+            lines.append("# HELP {} {}".format(family.name, family.help))
+            lines.append("# TYPE {} {}".format(family.name, family.kind))
+            for values, series in list(family.series.items()):
+                labels = list(zip(family.label_names, values))
+                if family.kind == "histogram":
+                    total = 0
+                    for bound, count in zip(series.buckets, series.counts):
+                        total += count
+                        lines.append("{}_bucket{} {}".format(family.name, _labels(labels + [("le", bound)]), total))
+                    lines.append("{}_bucket{} {}".format(family.name, _labels(labels + [("le", "+Inf")]),
+                                                         series.count))
+                    lines.append("{}_sum{} {}".format(family.name, _labels(labels), series.sum))
+                    lines.append("{}_count{} {}".format(family.name, _labels(labels), series.count))
+                else:
+                    lines.append("{}{} {}".format(family.name, _labels(labels), series()))
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One line of every series for the log, histograms as count p50 p99 in ms"""
+        parts = []
+        with self._lock:
+            families = list(self._families.values())
+        for family in families:
+            name = family.name[len("jlights_"):] if family.name.startswith("jlights_") else family.name
+            for values, series in list(family.series.items()):
+                key = "{}[{}]".format(name, ",".join(str(value) for value in values)) if values else name
+                if family.kind == "histogram":
+                    if series.count:
+                        parts.append("{}={} p50={:.2f}ms p99={:.2f}ms".format(
+                            key, series.count, series.quantile(0.5) * 1000, series.quantile(0.99) * 1000))
+                else:
+                    value = series()
+                    parts.append("{}={}".format(key, round(value, 1) if isinstance(value, float) else value))
+        return " ".join(parts)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, _escape_label(value)) for name, value in labels) + "}"
+
+
+def _escape_label(value):
+    """Label values are free text, ie strip names from the hub config, escaped as the text format requires"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = MetricsRegistry()
+
+SETTER_SECONDS = METRICS.histogram("jlights_setter_seconds", "Time spent in a HomeKit setter callback",
+                                   ("strip", "setter"))
+
+
+def timed_setter(setter):
+    """Records how long a setter callback takes in jlights_setter_seconds
+    For methods of an accessory, the strip label is its display_name"""
+    histograms = {}
+
+    @functools.wraps(setter)
+    def timed(self, value):
+        start = time.perf_counter()
+        try:
+            return setter(self, value)
+        finally:
+            histogram = histograms.get(self.display_name)
+            if histogram is None:
+                histogram = histograms[self.display_name] = SETTER_SECONDS.labels(self.display_name, setter.__name__)
+            histogram.observe(time.perf_counter() - start)
+    return timed
+
+
+def start_http_server(port, host="127.0.0.1", registry=METRICS):
+    """Serves the metrics on http://host:port/metrics from a daemon thread
+    host - interface to listen on, "0.0.0.0" for every interface - Normal:"127.0.0.1" only this Pi
+    http.server is only imported here, it is slow to import and most runs don't serve metrics"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path in ("/", "/metrics"):
+                body = registry.render().encode("utf-8")
+            elif self.path == "/trace":
+                from event_trace import TRACE
+                body = TRACE.format().encode("utf-8")
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scraped every few seconds, keep it out of the log
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="Metrics http", daemon=True).start()
+    logger.info("Metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def start_log(interval, registry=METRICS):
+    """Logs registry.summary() every interval seconds from a daemon thread"""
+    def log_summary():
+        while True:
+            time.sleep(interval)
+            logger.info(registry.summary())
+    thread = threading.Thread(target=log_summary, name="Metrics log", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_from_env():
+    """Starts the endpoint and log line asked for by JLIGHTS_METRICS_PORT, JLIGHTS_METRICS_HOST
+    and JLIGHTS_METRICS_LOG"""
+    port = os.environ.get("JLIGHTS_METRICS_PORT")
+    if port:
+        start_http_server(int(port), os.environ.get("JLIGHTS_METRICS_HOST", "127.0.0.1"))
+    interval = os.environ.get("JLIGHTS_METRICS_LOG")
+    if interval:
+        start_log(float(interval))
@@ -4,45 +4,60 @@ This is:
 1. Create the Accessory object you want.
 2. Add it to an AccessoryDriver, which will advertise it on the local network,
     setup a server to answer client queries, etc.
+
+The strip is lit from its last saved state before pyhap and numpy are imported,
+so it comes back within milliseconds of boot instead of after HomeKit starts - See fast_boot.py
 """
 import logging
 import signal
 
-from pyhap.accessory import Bridge
-from pyhap.accessory_driver import AccessoryDriver
-import pyhap.loader as loader
-
-# The below package can be found in the HAP-python github repo under accessories/
-#from accessories.TemperatureSensor import TemperatureSensor
-from NeoPixelLightStrip import NeoPixelLightStrip_Fader
+import fast_boot
 
 logging.basicConfig(level=logging.INFO)
 
+SNAPSHOT_FILE = "neopixel.snapshot"  # Last state of the strip, kept up to date by the accessory
+
+
+def get_bridge(driver, config_file=None):
+    """Call this method to get a Bridge instead of a standalone accessory.
+    The strips on the bridge come from the hub config - See hub.py"""
+    import hub
+    return hub.build_bridge(driver, hub.load_config(config_file or hub.DEFAULT_CONFIG_FILE))
+
+
+def get_accessory(driver, output=None):
+    """Call this method to get a standalone Accessory.
+    output - the strip already lit by fast_boot - Normal:None creates it"""
+    from NeoPixelLightStrip import NeoPixelLightStrip_Fader
+    return NeoPixelLightStrip_Fader(False, 144, True, 18, 800000, 10, 255, False, driver, 'NeoPixel',
+                                    output=output, snapshot_file=SNAPSHOT_FILE)
 
-def get_bridge(driver):
-    """Call this method to get a Bridge instead of a standalone accessory."""
-    bridge = Bridge(driver, 'Bridge')
-    temp_sensor = TemperatureSensor(driver, 'Sensor 2')
-    temp_sensor2 = TemperatureSensor(driver, 'Sensor 1')
-    bridge.add_accessory(temp_sensor)
-    bridge.add_accessory(temp_sensor2)
+if __name__ == '__main__':
+    # Light the strip first, everything below takes a while to import on a Pi Zero
+    output = fast_boot.light_from_snapshot(SNAPSHOT_FILE, 144, "GRB", 18)
 
-    return bridge
+    from pyhap.accessory_driver import AccessoryDriver
 
+    import event_trace
+    import metrics
+    import profiling
 
-def get_accessory(driver):
-    """Call this method to get a standalone Accessory."""
-    return NeoPixelLightStrip_Fader(False, 144, True, 18, 800000, 10, 255, False, driver, 'NeoPixel')
+    # JLIGHTS_METRICS_PORT=9100 serves latency and frame metrics - See metrics.py
+    metrics.start_from_env()
+    # kill -USR1 <pid> writes the recent setter, mode and frame events - See event_trace.py
+    event_trace.install_dump_signal()
+    # python3 profiling.py <pid> starts and stops a profile of the running accessory
+    profiling.install_signal()
 
-# Start the accessory on port 51826
-driver = AccessoryDriver(port=8476)
+    # Start the accessory on port 51826
+    driver = AccessoryDriver(port=8476)
 
-# Change `get_accessory` to `get_bridge` if you want to run a Bridge.
-driver.add_accessory(accessory=get_accessory(driver))
+    # Change `get_accessory` to `get_bridge` if you want to run a Bridge.
+    driver.add_accessory(accessory=get_accessory(driver, output))
 
-# We want SIGTERM (kill) to be handled by the driver itself,
-# so that it can gracefully stop the accessory, server and advertising.
-signal.signal(signal.SIGTERM, driver.signal_handler)
+    # We want SIGTERM (kill) to be handled by the driver itself,
+    # so that it can gracefully stop the accessory, server and advertising.
+    signal.signal(signal.SIGTERM, driver.signal_handler)
 
-# Start it!
-driver.start()
\ No newline at end of file
+    # Start it!
+    driver.start()
@@ -1,17 +1,23 @@
-"""Starts a fake fan, lightbulb, garage door and a TemperatureSensor
+"""Starts a single RGBW NeoPixel strip accessory
+The NeoPixelLightStrip class can also be hosted on the hub - See hub.py
 """
 import logging
 import signal
 import random
 
 import time
-import board
-import neopixel
 
 from pyhap.accessory import Accessory, Bridge
 from pyhap.accessory_driver import AccessoryDriver
 from pyhap.const import (CATEGORY_LIGHTBULB)
 
+from calibration import Calibration
+from color_conversion import hsv_to_rgbw, mired_to_rgbw
+from event_trace import TRACE
+from frame_buffer import FrameBuffer
+from metrics import timed_setter
+from output_backends import make_output
+
 
 logging.basicConfig(level=logging.INFO, format="[%(module)s] %(message)s")
 
@@ -21,7 +27,7 @@ class NeoPixelLightStrip(Accessory):
 
     def __init__(self, LED_count, is_GRB, LED_pin,
                  LED_freq_hz, LED_DMA, LED_brightness,
-                 LED_invert, *args, **kwargs):
+                 LED_invert, *args, render_thread=None, output=None, calibration=None, **kwargs):
 
         """
         LED_Count - the number of LEDs in the array
@@ -33,6 +39,10 @@ class NeoPixelLightStrip(Accessory):
         LED_invert - Normal:False
         For more information regarding these settings
             please review rpi_ws281x source code
+        render_thread - shared RenderThread to push frames on - Normal:None frames go straight to the strip
+        output - output backend for this strip ie "ddp:192.168.1.50" - Normal:None uses JLIGHTS_OUTPUT
+        calibration - gamma, white balance and current limit of this strip, a calibration.Calibration
+                      or its config dict - Normal:None linear
         """
 
         super().__init__(*args, **kwargs)
@@ -46,7 +56,7 @@ class NeoPixelLightStrip(Accessory):
 
         # Set our neopixel API services up using Lightbulb base
         serv_light = self.add_preload_service(
-            'Lightbulb', chars=['On', 'Hue', 'Saturation', 'Brightness'])
+            'Lightbulb', chars=['On', 'Hue', 'Saturation', 'Brightness', 'ColorTemperature'])
 
         # Configure our callbacks
         self.char_hue = serv_light.configure_char(
@@ -57,119 +67,82 @@ class NeoPixelLightStrip(Accessory):
             'On', setter_callback=self.set_state)
         self.char_on = serv_light.configure_char(
             'Brightness', setter_callback=self.set_brightness)
+        self.char_temperature = serv_light.configure_char(
+            'ColorTemperature', setter_callback=self.set_temperature)
 
         # Set our instance variables
         self.accessory_state = 0  # State of the neo light On/Off
         self.hue = 0  # Hue Value 0 - 360 Homekit API
         self.saturation = 100  # Saturation Values 0 - 100 Homekit API
         self.brightness = 100  # Brightness value 0 - 100 Homekit API
+        self.temperature = None  # ColorTemperature 140 - 500 mired Homekit API, None while showing a hue
 
         self.is_GRB = is_GRB  # Most neopixels are Green Red Blue
         self.LED_count = LED_count
 
-        self.neo_strip = neopixel.NeoPixel(board.D18, 4, brightness=1, auto_write=False, pixel_order=neopixel.RGBW)
+        self.neo_strip = make_output(LED_count, "GRBW", LED_pin, output)
+        self.frame = FrameBuffer(LED_count, "GRBW", calibration=Calibration.from_config(calibration))
+        # When hosted on a hub the hub's render thread pushes our frames
+        self.render_output = render_thread.channel(self.neo_strip, self.display_name) if render_thread is not None else self.neo_strip
 
+    @timed_setter
     def set_state(self, value):
+        TRACE.record("setter", self.display_name, "set_state", value)
         self.accessory_state = value
         if value == 1:  # On
-            self.set_hue(self.hue)
+            self.update_current_color()
         else:
             self.update_neopixel_with_color(0, 0, 0, 0)  # On
 
+    @timed_setter
     def set_hue(self, value):
-        # Lets only write the new RGB values if the power is on
-        # otherwise update the hue value only
-        if self.accessory_state == 1:
-            self.hue = value
-            rgb_tuple = self.hsv_to_rgbw(
-                self.hue, self.saturation, self.brightness)
-            if len(rgb_tuple) == 4:
-                self.update_neopixel_with_color(
-                    rgb_tuple[0], rgb_tuple[1], rgb_tuple[2], rgb_tuple[3])
-                print("r:", rgb_tuple[0], "g:", rgb_tuple[1], "b:", rgb_tuple[2], "w:", rgb_tuple[3])
-        else:
-            self.hue = value
-
+        TRACE.record("setter", self.display_name, "set_hue", value)
+        self.hue = value
+        self.temperature = None
+        self.update_current_color()
+
+    @timed_setter
+    def set_temperature(self, value):
+        TRACE.record("setter", self.display_name, "set_temperature", value)
+        self.temperature = value
+        self.update_current_color()
+
+    @timed_setter
     def set_brightness(self, value):
+        TRACE.record("setter", self.display_name, "set_brightness", value)
         self.brightness = value
-        self.set_hue(self.hue)
+        self.update_current_color()
 
+    @timed_setter
     def set_saturation(self, value):
+        TRACE.record("setter", self.display_name, "set_saturation", value)
         self.saturation = value
-        self.set_hue(self.hue)
+        self.temperature = None
+        self.update_current_color()
+
+    def update_current_color(self):
+        """Shows the HomeKit color or color temperature - Only written when the power is on"""
+        if self.accessory_state != 1:
+            return
+        if self.temperature is not None:
+            rgbw_tuple = mired_to_rgbw(self.temperature, self.brightness)
+        else:
+            rgbw_tuple = hsv_to_rgbw(self.hue, self.saturation, self.brightness)
+        self.update_neopixel_with_color(*rgbw_tuple)
+        TRACE.record("rgbw", self.display_name, *rgbw_tuple)
 
     def update_neopixel_with_color(self, red, green, blue, white = 0):
-        self.neo_strip.fill((green, red, blue, white))
-        self.neo_strip.show()
-
-    def hsv_to_rgbw(self, h, s, v):
-        """
-        This function takes
-         h - 0 - 360 Deg
-         s - 0 - 100 %
-         v - 0 - 100 %
-
-         h   s   v
-
-        030 076 100
-
-300 002 100     300 002 100
-
-        222 020 100
-
-        siri warm white, 100w tungston: h 31 s 33 v 100
-        siri cool white, cool florescent:h 208 s 17 v 100
-        siri white: h 0 s 0 v 100
-
-        """
-        print("h", h, "s", s, "v", v)
-
-        if s < 40 and h > 200:
-          #cool white request
-          w = (v / 100) * 255
-        elif h < 31 and s < 80:
-          # warm white request
-          w = (v / 100) * 255
-        else:
-          w = 0
-
-        hPri = h / 60
-        s = s / 100
-        v = v / 100
-
-        if s <= 0.0:
-            return int(0), int(0), int(0)
-
-        C = v * s  # Chroma
-        X = C * (1 - abs(hPri % 2 - 1))
-
-        RGB_Pri = [0.0, 0.0, 0.0]
-
-        if 0 <= hPri <= 1:
-            RGB_Pri = [C, X, 0]
-        elif 1 <= hPri <= 2:
-            RGB_Pri = [X, C, 0]
-        elif 2 <= hPri <= 3:
-            RGB_Pri = [0, C, X]
-        elif 3 <= hPri <= 4:
-            RGB_Pri = [0, X, C]
-        elif 4 <= hPri <= 5:
-            RGB_Pri = [X, 0, C]
-        elif 5 <= hPri <= 6:
-            RGB_Pri = [C, 0, X]
-        else:
-            RGB_Pri = [0, 0, 0]
+        self.frame.fill(red, green, blue, white)
+        self.frame.show(self.render_output)
 
-        m = v - C
-        
-        return int((RGB_Pri[0] + m) * 255), int((RGB_Pri[1] + m) * 255), int((RGB_Pri[2] + m) * 255), int(w)
 
 def get_accessory(driver):
     """Call this method to get a standalone Accessory."""
-    return NeoPixelLightStrip(2, True, 18, 800000, 10, 255, False, driver, 'NeoPixel')
+    return NeoPixelLightStrip(4, True, 18, 800000, 10, 255, False, driver, 'NeoPixel')
 
-driver = AccessoryDriver(port=51826, persist_file='one_accessory.state')
-driver.add_accessory(get_accessory(driver))
+if __name__ == '__main__':
+    driver = AccessoryDriver(port=51826, persist_file='one_accessory.state')
+    driver.add_accessory(get_accessory(driver))
 
-signal.signal(signal.SIGTERM, driver.signal_handler)
-driver.start()
\ No newline at end of file
+    signal.signal(signal.SIGTERM, driver.signal_handler)
+    driver.start()
@@ -0,0 +1,301 @@
+"""
+Output backends the frame buffer pushes frames to
+ Every backend takes a whole frame of wire ordered bytes in one call
+     output.write(wire_bytes)
+
+ NeoPixelOutput - Adafruit neopixel strip on a Raspberry Pi GPIO pin
+ SimulatedStrip - no hardware, records frames in memory or to a file and models
+                  the time the frame takes on the wire so accessories can be
+                  profiled and load tested on any Linux box
+ DDPOutput - network pixel controller speaking DDP over UDP (WLED, ESPixelStick, Falcon)
+ E131Output - network pixel controller speaking E1.31 (sACN) over UDP, one universe
+              per 170 RGB or 128 RGBW pixels
+
+ make_output() picks the backend from the JLIGHTS_OUTPUT environment variable so
+ the accessory scripts run against the simulated strip unchanged
+     JLIGHTS_OUTPUT=neopixel           - real strip (default)
+     JLIGHTS_OUTPUT=sim                - simulated strip, frames kept in memory
+     JLIGHTS_OUTPUT=sim:/tmp/frames.bin - simulated strip, frames written to the file
+     JLIGHTS_OUTPUT=ddp:192.168.1.50[:port] - DDP controller - Normal port:4048
+     JLIGHTS_OUTPUT=e131:192.168.1.50[:universe] - E1.31 controller - Normal first universe:1
+ The hub can give each strip its own backend with the same strings - See hub.py
+
+ Network outputs send the bytes in the strip's pixel order, set the controller
+ to the same order or pick the matching is_GRB.
+ Every packet of a strip is preallocated once with its header filled in, a frame
+ only copies the pixel bytes into the packets and patches the sequence number.
+ Python has no sendmmsg so the packets go out back to back with send() on a
+ connected non-blocking socket, no address lookup or allocation per packet.
+"""
+
+import os
+import socket
+import time
+import uuid
+from collections import deque
+
+NEOPIXEL_BIT_RATE = 800000  # bits per second on the wire
+NEOPIXEL_RESET_TIME = 0.00005  # seconds the line is held low to latch a frame
+
+
+class NeoPixelOutput:
+    """Adafruit neopixel strip attached to a GPIO pin"""
+
+    def __init__(self, LED_count, pixel_order="GRB", LED_pin=18):
+        """
+        LED_count - the number of LEDs in the array
+        pixel_order - wire color order of the strip - Normal:"GRB"
+        LED_pin - must be PWM pin 18 - Normal:18
+        """
+        # Imported here so nothing needs the Raspberry Pi libraries unless a real strip is used
+        import board
+        import neopixel
+
+        self.LED_count = LED_count
+        self.pixel_order = pixel_order
+        self.neo_strip = neopixel.NeoPixel(getattr(board, "D{}".format(LED_pin)), LED_count,
+                                           brightness=1.0, auto_write=False, pixel_order=pixel_order)
+
+    def write(self, wire_bytes):
+        # NeoPixel.show() would re-order and re-scale every pixel in python,
+        # our buffer is already in strip order so it goes straight to the driver
+        self.neo_strip._transmit(wire_bytes)
+
+
+class SimulatedStrip:
+    """A strip that only exists in memory
+    Each write takes as long as the frame would take on the wire, about 30us per
+    RGB LED at 800kHz plus the reset time, so latency and frame rate measurements
+    match a real strip"""
+
+    def __init__(self, LED_count, pixel_order="GRB", record_file=None, max_frames=1000,
+                 model_transfer_time=True):
+        """
+        LED_count - the number of LEDs in the array
+        pixel_order - wire color order of the strip - Normal:"GRB"
+        record_file - path frames are appended to as raw bytes, None keeps them in memory
+        max_frames - the most recent frames kept in memory - Normal:1000
+        model_transfer_time - sleep for the wire transfer time on every write - Normal:True
+        """
+        self.LED_count = LED_count
+        self.pixel_order = pixel_order
+        self.frame_size = LED_count * len(pixel_order)
+        self.transfer_time = self.frame_size * 8 / NEOPIXEL_BIT_RATE + NEOPIXEL_RESET_TIME
+        self.model_transfer_time = model_transfer_time
+
+        self.frames = deque(maxlen=max_frames)  # (time.monotonic(), bytes)
+        self.frames_written = 0
+        self.busy_time = 0.0  # Total seconds spent transferring frames
+        self._record_file = open(record_file, "ab") if record_file else None
+
+    def write(self, wire_bytes):
+        start = time.monotonic()
+        if self._record_file is not None:
+            self._record_file.write(wire_bytes)
+        else:
+            self.frames.append((start, bytes(wire_bytes)))
+        self.frames_written += 1
+
+        if self.model_transfer_time:
+            # The DMA transfer blocks the caller on a real strip, so do the same here
+            remaining = self.transfer_time - (time.monotonic() - start)
+            if remaining > 0:
+                time.sleep(remaining)
+        self.busy_time += time.monotonic() - start
+
+    @property
+    def last_frame(self):
+        """Bytes of the most recent frame kept in memory, None if there is none"""
+        return self.frames[-1][1] if self.frames else None
+
+    def close(self):
+        if self._record_file is not None:
+            self._record_file.close()
+            self._record_file = None
+
+
+class _UDPOutput:
+    """Preallocated packets sent back to back over a connected UDP socket"""
+
+    def __init__(self, LED_count, pixel_order, host, port, pixels_per_packet, header_size):
+        self.LED_count = LED_count
+        self.pixel_order = pixel_order
+        self.host = host
+        self.port = port
+        self.frame_size = LED_count * len(pixel_order)
+        self.frames_written = 0
+        self.packets_sent = 0
+        self.send_errors = 0  # packets the socket refused, ie the controller is unreachable
+        self.sequence = 0
+
+        # (packet, data start in the frame, data stop in the frame) for every packet of a frame
+        chunk = pixels_per_packet * len(pixel_order)
+        self._packets = []
+        for start in range(0, self.frame_size, chunk):
+            stop = min(start + chunk, self.frame_size)
+            self._packets.append((bytearray(header_size + stop - start), start, stop))
+        self._header_size = header_size
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.connect((host, port))
+
+    def write(self, wire_bytes):
+        header_size = self._header_size
+        self.sequence = self._next_sequence()
+        self._set_sequence(self.sequence)
+        sent = 0
+        with memoryview(wire_bytes) as data:
+            for packet, start, stop in self._packets:
+                packet[header_size:] = data[start:stop]
+                try:
+                    self._sock.send(packet)
+                    sent += 1
+                except OSError:
+                    # A full socket buffer, an ICMP refused or no route to the controller, drop the
+                    # packet rather than stall the render thread, the next frame replaces it
+                    self.send_errors += 1
+        self.packets_sent += sent
+        self.frames_written += 1
+
+    @property
+    def packets_per_frame(self):
+        return len(self._packets)
+
+    def close(self):
+        self._sock.close()
+
+
+class DDPOutput(_UDPOutput):
+    """Pixel controller speaking DDP - http://www.3waylabs.com/ddp/
+    A frame is sent as packets of up to 480 RGB pixels at increasing data offsets,
+    the push flag on the last packet tells the controller to show the frame"""
+
+    PORT = 4048
+    HEADER_SIZE = 10
+    MAX_DATA = 1440  # bytes of pixel data per packet, keeps packets under a 1500 byte MTU
+    FLAG_VERSION_1 = 0x40
+    FLAG_PUSH = 0x01
+    TYPE_RGB24 = 0x0B  # 3 channels of 8 bits
+    TYPE_RGBW32 = 0x1B  # 4 channels of 8 bits
+    DEVICE_DEFAULT = 0x01
+
+    def __init__(self, LED_count, pixel_order="RGB", host="127.0.0.1", port=PORT):
+        """
+        LED_count - the number of LEDs in the array
+        pixel_order - color order the bytes are sent in - Normal:"RGB"
+        host - address of the controller
+        port - UDP port of the controller - Normal:4048
+        """
+        channels = len(pixel_order)
+        super().__init__(LED_count, pixel_order, host, port, self.MAX_DATA // channels, self.HEADER_SIZE)
+
+        data_type = self.TYPE_RGBW32 if channels == 4 else self.TYPE_RGB24
+        for index, (packet, start, stop) in enumerate(self._packets):
+            last = index == len(self._packets) - 1
+            packet[0] = self.FLAG_VERSION_1 | (self.FLAG_PUSH if last else 0)
+            packet[2] = data_type
+            packet[3] = self.DEVICE_DEFAULT
+            packet[4:8] = start.to_bytes(4, "big")
+            packet[8:10] = (stop - start).to_bytes(2, "big")
+
+    def _next_sequence(self):
+        return self.sequence % 15 + 1  # 1 - 15, 0 means the controller ignores sequence numbers
+
+    def _set_sequence(self, sequence):
+        for packet, start, stop in self._packets:
+            packet[1] = sequence
+
+
+class E131Output(_UDPOutput):
+    """Pixel controller speaking E1.31 (sACN) - ANSI E1.31-2018
+    Each universe carries 170 RGB or 128 RGBW pixels so no pixel is split across universes"""
+
+    PORT = 5568
+    HEADER_SIZE = 126
+    DMX_SLOTS = 512
+    PRIORITY = 100  # Normal E1.31 priority, 0 - 200
+
+    def __init__(self, LED_count, pixel_order="RGB", host="127.0.0.1", universe=1, port=PORT,
+                 source_name="jlights"):
+        """
+        LED_count - the number of LEDs in the array
+        pixel_order - color order the bytes are sent in - Normal:"RGB"
+        host - address of the controller, unicast
+        universe - first universe, the strip uses as many as it needs from here - Normal:1
+        port - UDP port of the controller - Normal:5568
+        source_name - name the controller shows for this source
+        """
+        channels = len(pixel_order)
+        super().__init__(LED_count, pixel_order, host, port, self.DMX_SLOTS // channels, self.HEADER_SIZE)
+        self.universe = universe
+
+        cid = uuid.uuid4().bytes  # Component identifier, unique to this sender
+        name = source_name.encode("utf-8")[:63].ljust(64, b"\0")
+        for index, (packet, start, stop) in enumerate(self._packets):
+            data_length = stop - start
+            packet_length = self.HEADER_SIZE + data_length
+            # Root layer
+            packet[0:2] = (0x0010).to_bytes(2, "big")  # Preamble size
+            packet[2:4] = (0x0000).to_bytes(2, "big")  # Postamble size
+            packet[4:16] = b"ASC-E1.17\0\0\0"
+            packet[16:18] = (0x7000 | (packet_length - 16)).to_bytes(2, "big")
+            packet[18:22] = (0x00000004).to_bytes(4, "big")  # VECTOR_ROOT_E131_DATA
+            packet[22:38] = cid
+            # Framing layer
+            packet[38:40] = (0x7000 | (packet_length - 38)).to_bytes(2, "big")
+            packet[40:44] = (0x00000002).to_bytes(4, "big")  # VECTOR_E131_DATA_PACKET
+            packet[44:108] = name
+            packet[108] = self.PRIORITY
+            packet[109:111] = (0).to_bytes(2, "big")  # No synchronization universe
+            packet[112] = 0  # Options
+            packet[113:115] = (universe + index).to_bytes(2, "big")
+            # DMP layer
+            packet[115:117] = (0x7000 | (packet_length - 115)).to_bytes(2, "big")
+            packet[117] = 0x02  # VECTOR_DMP_SET_PROPERTY
+            packet[118] = 0xA1  # Address type and data type
+            packet[119:121] = (0x0000).to_bytes(2, "big")  # First property address
+            packet[121:123] = (0x0001).to_bytes(2, "big")  # Address increment
+            packet[123:125] = (data_length + 1).to_bytes(2, "big")  # DMX start code + slots
+            packet[125] = 0x00  # DMX start code
+
+    @property
+    def universes(self):
+        return range(self.universe, self.universe + len(self._packets))
+
+    def _next_sequence(self):
+        return (self.sequence + 1) & 0xFF
+
+    def _set_sequence(self, sequence):
+        for packet, start, stop in self._packets:
+            packet[111] = sequence
+
+
+def _split_host(address, default):
+    """host[:number] -> (host, number)"""
+    host, _, number = address.partition(":")
+    return host, int(number) if number else default
+
+
+def make_output(LED_count, pixel_order="GRB", LED_pin=18, backend=None):
+    """Creates an output backend - See module docstring
+    backend - backend string, ie "sim" or "ddp:192.168.1.50" - Normal:None uses JLIGHTS_OUTPUT
+              an output that was already created, ie by fast_boot, is returned as it is"""
+    if hasattr(backend, "write"):
+        return backend
+    if backend is None:
+        backend = os.environ.get("JLIGHTS_OUTPUT", "neopixel")
+    if backend == "neopixel":
+        return NeoPixelOutput(LED_count, pixel_order, LED_pin)
+    if backend == "sim":
+        return SimulatedStrip(LED_count, pixel_order)
+    if backend.startswith("sim:"):
+        return SimulatedStrip(LED_count, pixel_order, record_file=backend[len("sim:"):])
+    if backend.startswith("ddp:"):
+        host, port = _split_host(backend[len("ddp:"):], DDPOutput.PORT)
+        return DDPOutput(LED_count, pixel_order, host, port)
+    if backend.startswith("e131:"):
+        host, universe = _split_host(backend[len("e131:"):], 1)
+        return E131Output(LED_count, pixel_order, host, universe)
+    raise ValueError("Unknown output backend {} - Use neopixel, sim, sim:<file>, ddp:<host> or e131:<host>"
+                     .format(backend))
@@ -0,0 +1,207 @@
+"""
+On demand profiling of a running accessory
+ Starts and stops a profile of the live process on a signal so a strip that
+ stutters in the field can be looked at without restarting or redeploying.
+
+ Modes - JLIGHTS_PROFILE_MODE
+ cprofile - cProfile of the HAP event loop thread, where every setter, fade and
+            effect frame runs (default)
+ sample - samples the stacks of every thread, render thread included, every
+          JLIGHTS_PROFILE_INTERVAL seconds (Normal:0.005) into collapsed stacks
+          for flamegraph.pl or speedscope
+
+ While a profile runs every frame clock tick and frame buffer show() is also
+ timed, the timings are written next to the profile.
+
+ Use
+     python3 profiling.py <pid>   - starts a profile, run it again to stop it
+     kill -USR2 <pid>             - the same
+ Reports go to JLIGHTS_PROFILE_DIR - Normal:/tmp
+     jlights-<pid>-<time>.prof / .txt - cProfile stats, .txt sorted by cumulative time
+     jlights-<pid>-<time>.folded - sampled stacks
+     jlights-<pid>-<time>.timings.csv - kind, start, seconds of every tick and show
+"""
+
+import io
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_TIMINGS = 200000  # tick and show timings kept per profile, about 10 minutes of 2 strips at 60 FPS
+
+
+class Timings:
+    """Tick and show durations recorded while a profile runs
+    Callers check enabled before timing so nothing is measured the rest of the time"""
+
+    def __init__(self):
+        self.enabled = False
+        self._records = []
+
+    def start(self):
+        self._records = []
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        return self._records
+
+    def add(self, kind, start, seconds):
+        if len(self._records) < MAX_TIMINGS:
+            self._records.append((kind, start, seconds))
+
+
+TIMINGS = Timings()
+
+
+class _StackSampler:
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="Profile sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while self._running:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename),
+                                                     code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+
+class Profiler:
+
+    def __init__(self, mode=None, report_dir=None, interval=None):
+        """
+        mode - "cprofile" or "sample" - Normal:JLIGHTS_PROFILE_MODE or cprofile
+        report_dir - directory reports are written to - Normal:JLIGHTS_PROFILE_DIR or /tmp
+        interval - seconds between stack samples - Normal:JLIGHTS_PROFILE_INTERVAL or 0.005
+        """
+        self.mode = mode or os.environ.get("JLIGHTS_PROFILE_MODE", "cprofile")
+        if self.mode not in ("cprofile", "sample"):
+            raise ValueError("Unknown profile mode {} - Use cprofile or sample".format(self.mode))
+        self.report_dir = report_dir or os.environ.get("JLIGHTS_PROFILE_DIR", "/tmp")
+        self.interval = interval or float(os.environ.get("JLIGHTS_PROFILE_INTERVAL", 0.005))
+        self._profile = None
+        self._sampler = None
+        self._start_time = None
+
+    @property
+    def running(self):
+        return self._start_time is not None
+
+    def start(self):
+        """Starts profiling - In cprofile mode call it on the thread to profile, the signal handler does"""
+        if self.running:
+            return
+        if self.mode == "cprofile":
+            import cProfile  # Imported when asked for so it doesn't slow down every boot
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _StackSampler(self.interval)
+            self._sampler.start()
+        TIMINGS.start()
+        self._start_time = time.time()
+        logger.info("Profiling started - %s", self.mode)
+
+    def stop(self):
+        """Stops profiling and writes the reports, returns the path they start with"""
+        if not self.running:
+            return None
+        timings = TIMINGS.stop()
+        base = os.path.join(self.report_dir, "jlights-{}-{}".format(
+            os.getpid(), time.strftime("%Y%m%d-%H%M%S", time.localtime(self._start_time))))
+        seconds = time.time() - self._start_time
+        self._start_time = None
+
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(base + ".prof")
+            import pstats
+            text = io.StringIO()
+            text.write("{:.1f} seconds profiled\n\n".format(seconds))
+            text.write(_timings_summary(timings))
+            pstats.Stats(self._profile, stream=text).sort_stats("cumulative").print_stats(50)
+            with open(base + ".txt", "w") as f:
+                f.write(text.getvalue())
+            self._profile = None
+        if self._sampler is not None:
+            self._sampler.stop()
+            with open(base + ".folded", "w") as f:
+                for stack, count in self._sampler.stacks.most_common():
+                    f.write("{} {}\n".format(stack, count))
+            self._sampler = None
+
+        with open(base + ".timings.csv", "w") as f:
+            f.write("kind,start,seconds\n")
+            for kind, start, duration in timings:
+                f.write("{},{:.6f},{:.6f}\n".format(kind, start, duration))
+        logger.info("Profile of %.1f seconds written to %s.*", seconds, base)
+        return base
+
+    def toggle(self):
+        return self.stop() if self.running else self.start()
+
+
+def _timings_summary(timings):
+    """count mean p50 p99 max of each kind in ms"""
+    by_kind = {}
+    for kind, start, seconds in timings:
+        by_kind.setdefault(kind, []).append(seconds)
+    lines = []
+    for kind, values in sorted(by_kind.items()):
+        values.sort()
+        lines.append("{:<20} count {:>7}  mean {:.3f}ms  p50 {:.3f}ms  p99 {:.3f}ms  max {:.3f}ms\n".format(
+            kind, len(values), sum(values) / len(values) * 1000, values[len(values) // 2] * 1000,
+            values[int(len(values) * 0.99)] * 1000, values[-1] * 1000))
+    return "".join(lines) + "\n"
+
+
+def install_signal(signum=signal.SIGUSR2, profiler=None):
+    """Toggles a profile every time the process gets signum
+    Signal handlers run on the main thread, which runs the HAP event loop in driver.start()"""
+    profiler = profiler or Profiler()
+
+    def toggle(signum, frame):
+        try:
+            profiler.toggle()
+        except Exception:
+            logger.exception("Profiler toggle failed")
+    signal.signal(signum, toggle)
+    return profiler
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("python3 profiling.py <pid> - starts a profile of the accessory, run again to stop it")
+        sys.exit(1)
+    os.kill(int(sys.argv[1]), signal.SIGUSR2)
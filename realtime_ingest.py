@@ -0,0 +1,146 @@
+"""
+Realtime frame ingest
+ Lets external software (visualizers, lighting consoles, xLights, LedFx) push
+ frames to a strip over the network while HomeKit keeps control of power and
+ brightness. The receiver listens on one UDP port and takes both protocols
+ DDP - http://www.3waylabs.com/ddp/ - the data offset picks the pixels, the push
+       flag ends the frame
+ E1.31 (sACN) - 170 RGB pixels per universe from the first universe up, the
+       last universe of the strip ends the frame
+
+ Packets are copied straight from the datagram into one preallocated RGB
+ buffer, there are no per pixel python objects. Incoming pixels are always RGB,
+ the frame buffer re-orders them for the strip.
+
+ Usage
+     receiver = RealtimeReceiver(LED_count, on_frame=show_frame, port=4048)
+     await receiver.start(loop)
+     receiver.pixels  # (LED_count, 3) uint8 - the newest frame
+     receiver.active(time.monotonic())  # False after TIMEOUT seconds without a frame
+
+ Counters
+ packets_received - every datagram
+ bad_packets - datagrams that were not DDP or E1.31 data for this strip
+ frames_received - complete frames handed to on_frame
+"""
+
+import asyncio
+import time
+
+import numpy as np
+
+DDP_PORT = 4048
+E131_PORT = 5568
+
+_DDP_FLAG_VERSION_MASK = 0xC0
+_DDP_FLAG_VERSION_1 = 0x40
+_DDP_FLAG_TIMECODE = 0x10
+_DDP_FLAG_QUERY = 0x08
+_DDP_FLAG_REPLY = 0x04
+_DDP_FLAG_PUSH = 0x01
+_DDP_DEVICE_CONFIG = 246  # DDP ids 246 - 254 are config and status, not pixels
+_DDP_DEVICE_ALL = 255
+
+_E131_ID = b"\x00\x10\x00\x00ASC-E1.17\x00\x00\x00"
+_E131_HEADER_SIZE = 126
+_E131_OPTION_PREVIEW = 0x80
+_E131_OPTION_TERMINATED = 0x40
+_E131_PIXELS_PER_UNIVERSE = 170
+
+
+class RealtimeReceiver(asyncio.DatagramProtocol):
+
+    TIMEOUT = 2.5  # seconds without a frame before the strip goes back to HomeKit
+
+    def __init__(self, LED_count, on_frame=None, port=DDP_PORT, universe=1, host="0.0.0.0"):
+        """
+        LED_count - the number of LEDs in the array
+        on_frame - called with no arguments on the event loop every time a frame completes
+        port - UDP port to listen on, DDP and E1.31 are both accepted - Normal:4048
+        universe - first E1.31 universe of the strip - Normal:1
+        host - address to listen on - Normal:all
+        """
+        self.LED_count = LED_count
+        self.on_frame = on_frame
+        self.port = port
+        self.host = host
+        self.universe = universe
+        self.last_universe = universe + (LED_count - 1) // _E131_PIXELS_PER_UNIVERSE
+
+        self._data = bytearray(LED_count * 3)
+        self.pixels = np.frombuffer(self._data, dtype=np.uint8).reshape(LED_count, 3)
+        self.last_frame_time = None  # time.monotonic() of the newest frame, None until one arrives
+        self.packets_received = 0
+        self.bad_packets = 0
+        self.frames_received = 0
+        self._transport = None
+
+    async def start(self, loop):
+        """Starts listening on the event loop"""
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(self.host, self.port))
+        self.port = self._transport.get_extra_info("sockname")[1]  # The real port when asked for port 0
+        return self
+
+    def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def active(self, now):
+        """True while frames are arriving"""
+        return self.last_frame_time is not None and now - self.last_frame_time < self.TIMEOUT
+
+    def expire(self):
+        """Drops back to HomeKit straight away, ie the sender said it stopped"""
+        self.last_frame_time = None
+
+    def datagram_received(self, data, addr):
+        self.packets_received += 1
+        if data[:16] == _E131_ID:
+            ok = self._e131_received(data)
+        elif len(data) >= 10 and data[0] & _DDP_FLAG_VERSION_MASK == _DDP_FLAG_VERSION_1:
+            ok = self._ddp_received(data)
+        else:
+            ok = False
+        if not ok:
+            self.bad_packets += 1
+
+    def _ddp_received(self, data):
+        flags = data[0]
+        if flags & (_DDP_FLAG_QUERY | _DDP_FLAG_REPLY) or _DDP_DEVICE_CONFIG <= data[3] < _DDP_DEVICE_ALL:
+            return False
+        header_size = 14 if flags & _DDP_FLAG_TIMECODE else 10
+        offset = int.from_bytes(data[4:8], "big")
+        length = min(int.from_bytes(data[8:10], "big"), len(data) - header_size, len(self._data) - offset)
+        if length > 0:
+            self._data[offset:offset + length] = memoryview(data)[header_size:header_size + length]
+        if flags & _DDP_FLAG_PUSH:
+            self._frame_complete()
+        return True
+
+    def _e131_received(self, data):
+        if len(data) < _E131_HEADER_SIZE or data[125] != 0x00:  # Only DMX start code 0 carries levels
+            return False
+        options = data[112]
+        if options & _E131_OPTION_PREVIEW:
+            return True  # Meant for visualizers, not for lights
+        if options & _E131_OPTION_TERMINATED:
+            self.expire()
+            return True
+        universe = int.from_bytes(data[113:115], "big")
+        if not self.universe <= universe <= self.last_universe:
+            return False
+        offset = (universe - self.universe) * _E131_PIXELS_PER_UNIVERSE * 3
+        slots = min(int.from_bytes(data[123:125], "big") - 1, len(data) - _E131_HEADER_SIZE,
+                    _E131_PIXELS_PER_UNIVERSE * 3, len(self._data) - offset)
+        if slots > 0:
+            self._data[offset:offset + slots] = memoryview(data)[_E131_HEADER_SIZE:_E131_HEADER_SIZE + slots]
+        if universe == self.last_universe:
+            self._frame_complete()
+        return True
+
+    def _frame_complete(self):
+        self.last_frame_time = time.monotonic()
+        self.frames_received += 1
+        if self.on_frame is not None:
+            self.on_frame()
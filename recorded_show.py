@@ -0,0 +1,169 @@
+"""
+Recorded shows
+ Records the frames an accessory pushes to its strip into a compact binary file
+ and plays them back later. Playback memory maps the file, every frame is a view
+ into the map at a fixed offset so there is no parsing, decoding or copying per
+ frame, a precomputed show costs almost no CPU even on a Pi Zero.
+
+ File format - little endian
+ header 32 bytes
+     magic      6s  b"JLSHOW"
+     version    H   1
+     LED_count  I
+     pixel_order 4s  wire color order ie b"GRB\\0"
+     frame_count I
+     fps        f   frame rate the show was recorded at
+     padding to 32 bytes
+ frames - frame_count times
+     time       d   seconds from the first frame
+     pixels     LED_count * len(pixel_order) bytes in wire order
+
+ A frame holds until the time of the next one, a recording from an accessory only
+ has the frames where the strip changed. Brightness and color order are already
+ applied so a show plays back on a strip with the same pixel order.
+
+ Record what an accessory shows
+     fader.start_recording("kitchen.show")
+     ...
+     fader.stop_recording()
+
+ Precompute an effect without waiting for it in real time
+     python3 recorded_show.py render rainbow 144 600 holiday.show [fps]
+
+ Play
+     show = RecordedShow("holiday.show")
+     output.write(show.frame_at(time.monotonic() - start))
+"""
+
+import mmap
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b"JLSHOW"
+VERSION = 1
+HEADER = struct.Struct("<6sHI4sIf")
+HEADER_SIZE = 32
+FRAME_TIME = struct.Struct("<d")
+
+
+class ShowRecorder:
+    """Output backend that records every frame written to it and passes it on to output
+    Frames are recorded at the time they are written, ie when the render thread pushes them"""
+
+    def __init__(self, path, LED_count, pixel_order="GRB", output=None, fps=60):
+        """
+        path - show file to write, it is replaced
+        LED_count - the number of LEDs in the array
+        pixel_order - wire color order of the frames - Normal:"GRB"
+        output - output backend frames are passed on to - Normal:None only record
+        fps - frame rate the show is rendered at, used for the show length - Normal:60
+        """
+        self.path = path
+        self.LED_count = LED_count
+        self.pixel_order = pixel_order
+        self.frame_size = LED_count * len(pixel_order)
+        self.output = output
+        self.fps = fps
+        self.frames_written = 0
+        self._start_time = None
+        self._lock = threading.Lock()  # Frames come from the render thread, close from the event loop
+        self._file = open(path, "wb")
+        self._write_header()
+
+    def write(self, wire_bytes, now=None):
+        """Records a frame - now is the frame time in seconds, Normal:time.monotonic()"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = now
+            if self._file is not None:
+                self._file.write(FRAME_TIME.pack(now - self._start_time))
+                self._file.write(wire_bytes)
+                self.frames_written += 1
+        if self.output is not None:
+            self.output.write(wire_bytes)
+
+    def close(self):
+        """Finishes the file - The frame count in the header is only right after close"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.seek(0)
+            self._write_header()
+            self._file.close()
+            self._file = None
+
+    def _write_header(self):
+        header = HEADER.pack(MAGIC, VERSION, self.LED_count, self.pixel_order.encode("ascii"),
+                             self.frames_written, self.fps)
+        self._file.write(header.ljust(HEADER_SIZE, b"\0"))
+
+
+class RecordedShow:
+    """Memory mapped show file"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, LED_count, pixel_order, frame_count, fps = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} jlights show".format(path, VERSION))
+        if frame_count == 0:
+            raise ValueError("{} has no frames - Was the recording closed?".format(path))
+        self.path = path
+        self.LED_count = LED_count
+        self.pixel_order = pixel_order.rstrip(b"\0").decode("ascii")
+        self.frame_size = LED_count * len(self.pixel_order)
+        self.frame_count = frame_count
+        self.fps = fps
+
+        # Views straight onto the map, nothing is read until a frame is used
+        record = np.dtype([("time", "<f8"), ("pixels", np.uint8, (self.frame_size,))])
+        records = np.frombuffer(self._map, dtype=record, count=frame_count, offset=HEADER_SIZE)
+        self.times = records["time"]
+        self.frames = records["pixels"]
+        self.duration = float(self.times[-1]) + 1 / fps  # The last frame holds for one frame
+
+    def frame_index_at(self, t, loop=True):
+        """Index of the frame showing t seconds into the show"""
+        if loop:
+            t %= self.duration
+        return max(int(np.searchsorted(self.times, t, side="right")) - 1, 0)
+
+    def frame_at(self, t, loop=True):
+        """(frame_size,) uint8 view of the frame showing t seconds into the show - Loops by default"""
+        return self.frames[self.frame_index_at(t, loop)]
+
+    def close(self):
+        self.times = self.frames = None
+        self._map.close()
+
+
+def render_effect(path, effect_name, LED_count, seconds, fps=60, pixel_order="GRB", params=None):
+    """Precomputes seconds of an effect into a show file as fast as the effect renders"""
+    from effects import EFFECTS
+    from frame_buffer import FrameBuffer
+
+    frame = FrameBuffer(LED_count, pixel_order)
+    recorder = ShowRecorder(path, LED_count, pixel_order, fps=fps)
+    for index in range(int(seconds * fps)):
+        t = index / fps
+        EFFECTS[effect_name](t, LED_count, params or {}, frame.pixels[:, :3])
+        recorder.write(frame.render(), now=t)
+    recorder.close()
+    return recorder.frames_written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 6 or sys.argv[1] != "render":
+        print("python3 recorded_show.py render <effect> <LED_count> <seconds> <file> [fps]")
+        sys.exit(1)
+    frames = render_effect(sys.argv[5], sys.argv[2], int(sys.argv[3]), float(sys.argv[4]),
+                           int(sys.argv[6]) if len(sys.argv) > 6 else 60)
+    print("Wrote {} frames to {}".format(frames, sys.argv[5]))
@@ -0,0 +1,154 @@
+"""
+Render thread that owns one or more output backends
+ show() on a long strip is a DMA transfer of several milliseconds. When it runs
+ on the HAP event loop every HomeKit request waits for it, and two writers
+ (setters and the fade loop) can race on the strip.
+
+ RenderThread is the only thing that writes to its outputs. Producers publish
+ frames with write() which copies the frame into a single slot mailbox and
+ returns straight away. The render thread always pushes the newest frame, a
+ frame that is replaced before it was pushed is dropped, so HomeKit response
+ time stays flat however long the strip is.
+
+ RenderThread has the same write() as the output backends so it can be given
+ to FrameBuffer.show() in place of the strip
+     render_thread = RenderThread(make_output(LED_count)).start()
+     frame.show(render_thread)
+
+ One thread can serve several strips, each strip gets its own mailbox
+     render_thread = RenderThread().start()
+     kitchen = render_thread.channel(make_output(144, "GRB", 18))
+     frame.show(kitchen)
+
+ Counters - per channel and summed on the thread
+ frames_published - frames given to write()
+ frames_rendered - frames pushed to the output
+ frames_dropped - frames replaced by a newer one before they were pushed
+ Each channel also records how long every push to its output takes - See metrics
+ The first frame pushed by any render thread is the process's time to first
+ frame - See fast_boot
+"""
+
+import threading
+import time
+
+from event_trace import TRACE
+from fast_boot import mark_first_frame, time_to_first_frame
+from metrics import METRICS
+
+SHOW_SECONDS = METRICS.histogram("jlights_show_seconds", "Time to push one frame to the strip", ("strip",))
+METRICS.gauge("jlights_time_to_first_frame_seconds", "Seconds from process start to the first frame on a strip",
+              time_to_first_frame)
+
+
+class RenderChannel:
+    """Mailbox for one output of a RenderThread - Use RenderThread.channel()"""
+
+    def __init__(self, render_thread, output, name):
+        self.output = output
+        self.name = name
+        self.frames_published = 0
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+        self.show_seconds = SHOW_SECONDS.labels(name)
+        METRICS.counter("jlights_frames_published_total", "Frames handed to the render thread",
+                        lambda: self.frames_published, strip=name)
+        METRICS.counter("jlights_frames_rendered_total", "Frames pushed to the strip",
+                        lambda: self.frames_rendered, strip=name)
+        METRICS.counter("jlights_frames_dropped_total", "Frames replaced by a newer one before they were pushed",
+                        lambda: self.frames_dropped, strip=name)
+
+        # Two buffers - the producer copies into _pending, the render thread pushes _front
+        self._pending = bytearray()
+        self._front = bytearray()
+        self._has_pending = False
+        self._condition = render_thread._condition
+
+    def write(self, wire_bytes):
+        """Publishes a frame without waiting for the strip - The bytes are copied"""
+        with self._condition:
+            if self._has_pending:
+                self.frames_dropped += 1
+            self._pending[:] = wire_bytes
+            self._has_pending = True
+            self.frames_published += 1
+            self._condition.notify()
+
+    def _take(self):
+        """Swaps the buffers so the producer can fill one while we push the other
+        Must be called with the condition held"""
+        self._front, self._pending = self._pending, self._front
+        self._has_pending = False
+        return self._front
+
+
+class RenderThread:
+
+    def __init__(self, output=None, name="RenderThread"):
+        """output - an output backend this thread owns, nothing else should write to it
+                    more outputs can be added with channel()"""
+        self._channels = []
+        self._running = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._default_channel = self.channel(output) if output is not None else None
+
+    def channel(self, output, name=None):
+        """Gives this thread ownership of output and returns the RenderChannel to write frames to
+        name - strip name the channel's metrics are labelled with - Normal:None numbered"""
+        if name is None:
+            name = "{} {}".format(self._thread.name, len(self._channels))
+        channel = RenderChannel(self, output, name)
+        with self._condition:
+            self._channels.append(channel)
+        return channel
+
+    @property
+    def output(self):
+        return self._default_channel.output
+
+    @property
+    def frames_published(self):
+        return sum(channel.frames_published for channel in self._channels)
+
+    @property
+    def frames_rendered(self):
+        return sum(channel.frames_rendered for channel in self._channels)
+
+    @property
+    def frames_dropped(self):
+        return sum(channel.frames_dropped for channel in self._channels)
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        """Pushes any pending frames then stops the thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def write(self, wire_bytes):
+        """Publishes a frame to the output given to the constructor"""
+        self._default_channel.write(wire_bytes)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not any(channel._has_pending for channel in self._channels):
+                    self._condition.wait()
+                frames = [(channel, channel._take()) for channel in self._channels if channel._has_pending]
+                if not frames and not self._running:
+                    return  # Stopped with nothing left to push
+
+            for channel, wire_bytes in frames:
+                start = time.perf_counter()
+                channel.output.write(wire_bytes)
+                channel.show_seconds.observe(time.perf_counter() - start)
+                mark_first_frame()
+                channel.frames_rendered += 1
+                TRACE.record("frame", channel.name, channel.frames_rendered)
@@ -0,0 +1,192 @@
+"""
+Shared memory frame buffer and effect worker processes
+ One python process can not compute effects for several long strips at frame
+ rate. With effect workers each strip's effect runs in its own process and is
+ written into a multiprocessing.shared_memory frame buffer, the process that
+ owns the strip reads the newest frame straight out of shared memory (no
+ pickling, no pipe) and pushes it to the strip. The HomeKit process only sends
+ the worker parameter changes, so effect throughput scales with the cores.
+
+ Shared memory layout
+ header - int64 sequence, int64 front slot
+ slot 0 - (LED_count, channels) uint8 pixels in RGB(W) order
+ slot 1 - (LED_count, channels) uint8 pixels in RGB(W) order
+
+ The worker draws into the back slot then publishes it by making it the front
+ slot and bumping the sequence. The reader renders from the front slot and
+ checks the sequence did not move while it read, if it did the worker may have
+ started drawing over that slot so the read is done again from the new front.
+
+ Usage
+     worker = EffectWorker(LED_count, fps=60).start()
+     worker.update({"effect": "rainbow", "params": {}, "start_time": time.monotonic(),
+                    "brightness": 100, "on": True})
+     worker.frame.read(frame.render)  # FrameBuffer renders straight from shared memory
+     frame.push(output)
+     worker.stop()
+"""
+
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_HEADER = np.dtype([("sequence", np.int64), ("front", np.int64)])
+READ_RETRIES = 3  # reads repeated when the worker publishes mid read before giving up on tear free
+
+
+class SharedFrameBuffer:
+    """Two pixel slots and a header in one shared memory segment"""
+
+    def __init__(self, LED_count, channels=3, name=None, create=False):
+        """
+        LED_count - the number of LEDs in the array
+        channels - 3 for RGB, 4 for RGBW - Normal:3
+        name - name of an existing segment to attach to, None with create=True picks one
+        create - create the segment, the creator unlinks it on close - Normal:False
+        """
+        self.LED_count = LED_count
+        self.channels = channels
+        slot_size = LED_count * channels
+        size = _HEADER.itemsize + 2 * slot_size
+
+        self._owner = create
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self.name = self._shm.name
+
+        buf = self._shm.buf
+        self._header = np.ndarray((), dtype=_HEADER, buffer=buf)
+        self.slots = (
+            np.ndarray((LED_count, channels), dtype=np.uint8, buffer=buf, offset=_HEADER.itemsize),
+            np.ndarray((LED_count, channels), dtype=np.uint8, buffer=buf, offset=_HEADER.itemsize + slot_size),
+        )
+        self.torn_reads = 0  # reads that kept racing the worker and may mix two frames
+
+    @property
+    def sequence(self):
+        """Number of frames published, 0 until the worker draws its first frame"""
+        return int(self._header["sequence"])
+
+    def back_slot(self):
+        """Pixels the writer draws the next frame into"""
+        return self.slots[1 - int(self._header["front"])]
+
+    def publish(self):
+        """Makes the back slot the front slot - Called by the writer after drawing a frame"""
+        self._header["front"] = 1 - int(self._header["front"])
+        self._header["sequence"] += 1
+
+    def read(self, render):
+        """Calls render(pixels) on the front slot without copying it
+        render must only read the pixels and be safe to repeat, ie FrameBuffer.render
+        Returns what render returned, the read is done again if the writer published mid read"""
+        for _ in range(READ_RETRIES):
+            sequence = int(self._header["sequence"])  # A copy, the header field is a live view
+            result = render(self.slots[int(self._header["front"])])
+            if self._header["sequence"] - sequence <= 0:
+                return result
+        self.torn_reads += 1
+        return result
+
+    def close(self):
+        # Drop our views before the segment is unmapped
+        self._header = None
+        self.slots = ()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class EffectWorker:
+    """Computes one strip's effect in a separate process into a SharedFrameBuffer
+    The state sent with update() is a dict
+    effect - name in effects.EFFECTS
+    params - effect params, see effects
+    start_time - time.monotonic() the effect started at, the clock is shared by every process
+    brightness - HomeKit brightness 0 - 100 applied to the whole frame
+    on - False pauses the worker"""
+
+    def __init__(self, LED_count, channels=3, fps=60):
+        """
+        LED_count - the number of LEDs in the array
+        channels - 3 for RGB, 4 for RGBW - Normal:3
+        fps - frames per second the worker draws at - Normal:60
+        """
+        self.LED_count = LED_count
+        self.fps = fps
+        self.frame = SharedFrameBuffer(LED_count, channels, create=True)
+
+        # spawn, not fork - the HomeKit process has the event loop, render thread and
+        # zeroconf threads running and a forked child can inherit their held locks
+        context = multiprocessing.get_context("spawn")
+        self._updates = context.Queue()
+        self._stop_event = context.Event()
+        self._process = context.Process(target=_worker_main, name="Effect worker",
+                                        args=(self.frame.name, LED_count, channels, fps,
+                                              self._updates, self._stop_event),
+                                        daemon=True)
+        self._last_state = None
+
+    def start(self):
+        self._process.start()
+        return self
+
+    def update(self, state):
+        """Sends the worker a new state - Nothing is sent when the state has not changed"""
+        if state == self._last_state:
+            return False
+        self._last_state = state
+        self._updates.put(state)
+        return True
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        self._updates.put(None)  # Wakes a paused worker
+        if self._process.is_alive():
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+        self._updates.close()
+        self.frame.close()
+
+
+def _worker_main(name, LED_count, channels, fps, updates, stop_event):
+    """Effect worker process - Draws frames until stop_event is set"""
+    # Imported in the worker so the parent does not need to import them first
+    from color_conversion import V_SCALE
+    from effects import EFFECTS
+
+    frame = SharedFrameBuffer(LED_count, channels, name=name)
+    state = {"on": False}
+    frame_interval = 1 / fps
+    next_frame_time = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            # Only the newest state matters
+            try:
+                while True:
+                    state = updates.get_nowait()
+                    if state is None:
+                        return
+            except queue.Empty:
+                pass
+
+            if state.get("on"):
+                now = time.monotonic()
+                pixels = frame.back_slot()
+                EFFECTS[state["effect"]](now - state["start_time"], LED_count, state["params"],
+                                         pixels[:, :3])
+                np.take(V_SCALE[state["brightness"]], pixels, out=pixels)
+                frame.publish()
+
+                next_frame_time = max(next_frame_time + frame_interval, now)
+                stop_event.wait(max(0.0, next_frame_time - time.monotonic()))
+            else:
+                state = updates.get()  # Nothing to draw, sleep until the next update
+                if state is None:
+                    return
+                next_frame_time = time.monotonic()
+    finally:
+        frame.close()